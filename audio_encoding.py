@@ -0,0 +1,72 @@
+import wave
+from io import BytesIO
+
+import numpy as np
+
+TARGET_SAMPLE_RATE = 16000 # What speech-to-text models consume anyway
+
+
+def _lowpass(samples, cutoff_ratio, taps=63):
+    # Windowed-sinc FIR so downsampling doesn't alias high frequencies into the speech band
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = cutoff_ratio * np.sinc(cutoff_ratio * n) * np.hamming(taps)
+    kernel /= kernel.sum()
+    return np.convolve(samples, kernel, mode="same")
+
+
+def downsample_wav(wav_bytes, target_rate=TARGET_SAMPLE_RATE):
+    """Converts a 16-bit PCM WAV recording to mono at target_rate; anything else is returned unchanged."""
+    with wave.open(BytesIO(wav_bytes), "rb") as reader:
+        channels = reader.getnchannels()
+        sample_width = reader.getsampwidth()
+        rate = reader.getframerate()
+        frames = reader.readframes(reader.getnframes())
+    if sample_width != 2 or (channels == 1 and rate <= target_rate):
+        return wav_bytes
+
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32)
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate > target_rate:
+        samples = _lowpass(samples, target_rate / rate)
+        duration = len(samples) / rate
+        target_times = np.arange(int(duration * target_rate)) / target_rate
+        samples = np.interp(target_times, np.arange(len(samples)) / rate, samples)
+        rate = target_rate
+
+    out = BytesIO()
+    with wave.open(out, "wb") as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(rate)
+        writer.writeframes(np.clip(np.round(samples), -32768, 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def flac_available():
+    try:
+        import soundfile # noqa: F401 - optional dependency
+        return True
+    except (ImportError, OSError): # OSError: libsndfile missing
+        return False
+
+
+def encode_flac(wav_bytes):
+    import soundfile
+    data, rate = soundfile.read(BytesIO(wav_bytes), dtype="int16")
+    out = BytesIO()
+    soundfile.write(out, data, rate, format="FLAC")
+    return out.getvalue()
+
+
+def encode_for_upload(wav_bytes, accepted_types):
+    """Picks the smallest encoding the server accepts. Returns (bytes, mime_type), or None when
+    none of the accepted types can be produced here (e.g. FLAC only, without soundfile)."""
+    if "audio/flac" in accepted_types and flac_available():
+        try:
+            return encode_flac(wav_bytes), "audio/flac"
+        except Exception as flac_err:
+            print(f"FLAC Encoding Error: {flac_err}") # Fall back to WAV, if the server takes it
+    if "audio/wav" in accepted_types:
+        return wav_bytes, "audio/wav"
+    return None
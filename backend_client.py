@@ -0,0 +1,230 @@
+import functools
+import gzip
+import json
+import threading
+import time
+from io import BytesIO
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+# (connect, read) timeouts in seconds per endpoint; batch calls scale the read timeout by batch size
+DEFAULT_TIMEOUTS = {
+    "capabilities": (5, 10),
+    "extract": (10, 60),
+    "summarise_features": (10, 120),
+    "chat_interaction": (10, 60),
+}
+
+
+class BackendClient:
+    """Thin client for the Kaggle/ngrok inference server.
+
+    Every call goes through one pooled requests.Session, so connections to the tunnel are
+    kept alive and reused across notes, summaries, chat turns and Streamlit reruns.
+    """
+
+    def __init__(self, base_url, pool_size=10, timeouts=None, gzip_requests=False, gzip_min_bytes=1024):
+        self.base_url = base_url.rstrip("/")
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.gzip_requests = gzip_requests
+        self.gzip_min_bytes = gzip_min_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=False, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Connection": "keep-alive"})
+        self._capabilities = None
+        self._capabilities_fetched_at = 0.0
+        self._capabilities_lock = threading.Lock()
+
+    def _timeout(self, endpoint, scale=1):
+        connect_timeout, read_timeout = self.timeouts[endpoint]
+        return (connect_timeout, read_timeout * max(1, scale))
+
+    def _post_json(self, path, body, endpoint, params=None, scale=1):
+        data = json.dumps(body).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.gzip_requests and len(data) >= self.gzip_min_bytes:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        with METRICS.timer(f"http.{path.strip('/')}") as measurement:
+            measurement.bytes_sent = len(data)
+            r = self.session.post(f"{self.base_url}{path}", data=data, headers=headers, params=params, timeout=self._timeout(endpoint, scale))
+            measurement.bytes_received = len(r.content)
+            r.raise_for_status() # Raise HTTPError for bad responses (4XX or 5XX)
+            return r.json()
+
+    def capabilities(self, ttl=300):
+        # Optional server features advertised at /capabilities, e.g.
+        # {"batch_endpoints": ["extract", "summarise_features"], "audio_upload_types": ["audio/wav", "audio/flac"], "index_notes": true}.
+        # Anything else (404, old server, tunnel down) means only the original single-item JSON calls.
+        with self._capabilities_lock:
+            if self._capabilities is None or time.time() - self._capabilities_fetched_at > ttl:
+                try:
+                    with METRICS.timer("http.capabilities"):
+                        r = self.session.get(f"{self.base_url}/capabilities", timeout=self._timeout("capabilities"))
+                        r.raise_for_status()
+                        capabilities = r.json()
+                    self._capabilities = capabilities if isinstance(capabilities, dict) else {}
+                except (requests.exceptions.RequestException, ValueError):
+                    self._capabilities = {}
+                self._capabilities_fetched_at = time.time()
+            return self._capabilities
+
+    def batch_endpoints(self):
+        return frozenset(self.capabilities().get("batch_endpoints", []))
+
+    def supports_note_indexing(self):
+        # /index_notes adds already-extracted notes to a session's vector store without running the model
+        return bool(self.capabilities().get("index_notes"))
+
+    def audio_upload_types(self):
+        # MIME types /chat_interaction accepts as a raw binary body instead of base64 JSON
+        return frozenset(self.capabilities().get("audio_upload_types", []))
+
+    def extract(self, text, session_id):
+        response_json = self._post_json("/extract", {"text": text, "session_id": session_id}, "extract")
+        return response_json.get("response", f"Error: 'response' key missing in API result from {self.base_url}/extract")
+
+    def extract_batch(self, texts, session_id):
+        response_json = self._post_json("/extract_batch", {"texts": texts, "session_id": session_id}, "extract", scale=len(texts))
+        responses = response_json.get("responses")
+        if not isinstance(responses, list) or len(responses) != len(texts):
+            raise ValueError(f"Batch response from {self.base_url}/extract_batch does not match the {len(texts)} notes sent")
+        return responses
+
+    def index_notes(self, texts, session_id):
+        self._post_json("/index_notes", {"texts": texts, "session_id": session_id}, "extract", scale=len(texts))
+
+    def summarise(self, features, session_id):
+        return self._post_json("/summarise_features", features, "summarise_features", params={"session_id": session_id})
+
+    def summarise_batch(self, features_list, session_id):
+        response_json = self._post_json(
+            "/summarise_features_batch", {"features": features_list}, "summarise_features",
+            params={"session_id": session_id}, scale=len(features_list),
+        )
+        results = response_json.get("results")
+        if not isinstance(results, list) or len(results) != len(features_list):
+            raise ValueError(f"Batch response does not match the {len(features_list)} feature sets sent")
+        return results
+
+    def chat(self, payload, session_id):
+        return self._post_json("/chat_interaction", payload, "chat_interaction", params={"session_id": session_id})
+
+    def _post_audio(self, audio_bytes, mime_type, params, stream=False):
+        # The body is a file-like object, so requests streams it in blocks instead of building one big string
+        return self.session.post(
+            f"{self.base_url}/chat_interaction",
+            data=BytesIO(audio_bytes),
+            headers={
+                "Content-Type": mime_type,
+                "Content-Length": str(len(audio_bytes)),
+                "Accept": "text/event-stream, text/plain, application/json",
+            },
+            params=params,
+            timeout=self._timeout("chat_interaction"),
+            stream=stream,
+        )
+
+    def chat_audio(self, audio_bytes, mime_type, session_id):
+        with METRICS.timer("http.chat_interaction_audio") as measurement:
+            measurement.bytes_sent = len(audio_bytes)
+            r = self._post_audio(audio_bytes, mime_type, {"session_id": session_id})
+            measurement.bytes_received = len(r.content)
+            r.raise_for_status()
+            return r.json()
+
+    def chat_stream(self, payload, session_id, audio_mime_type=None):
+        # Times the whole exchange, from sending the request to the last token
+        stage = "http.chat_interaction_audio_stream" if audio_mime_type else "http.chat_interaction_stream"
+        with METRICS.timer(stage) as measurement:
+            measurement.bytes_sent = len(payload) if audio_mime_type else len(json.dumps(payload))
+            for event_type, event_data in self._chat_stream(payload, session_id, audio_mime_type):
+                if event_type == "token":
+                    measurement.bytes_received += len(event_data.encode("utf-8"))
+                yield event_type, event_data
+
+    def _chat_stream(self, payload, session_id, audio_mime_type=None):
+        """Yields ("token", text) events as the reply is generated, then one ("final", response_data).
+
+        Understands SSE (text/event-stream, `data: {"token": ...}` lines ending with a `{"done": true, ...}`
+        event or `[DONE]`) and plain chunked text. A server that ignores stream=true and answers with JSON
+        yields a single final event, so callers get the non-streaming behaviour for free.
+        With audio_mime_type set, payload is the raw recording and is uploaded as a binary body.
+        """
+        params = {"session_id": session_id, "stream": "true"}
+        if audio_mime_type:
+            r = self._post_audio(payload, audio_mime_type, params, stream=True)
+        else:
+            r = self.session.post(
+                f"{self.base_url}/chat_interaction",
+                json=payload,
+                params=params,
+                headers={"Accept": "text/event-stream, text/plain, application/json"},
+                timeout=self._timeout("chat_interaction"),
+                stream=True,
+            )
+        if r.status_code >= 400:
+            r.content # Buffer the error body before the response is closed, so callers can still read e.response.json()/.text
+        with r:
+            r.raise_for_status()
+            content_type = r.headers.get("Content-Type", "")
+            if content_type.startswith("application/json"):
+                yield "final", r.json()
+                return
+
+            if r.encoding is None:
+                r.encoding = "utf-8"
+            tokens = []
+            if content_type.startswith("text/event-stream"):
+                final_data = {}
+                for line in r.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue # Blank separators, comments, event/id fields
+                    data = line[len("data:"):]
+                    if data.startswith(" "):
+                        data = data[1:] # SSE strips exactly one leading space
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        event = None
+                    if not isinstance(event, dict):
+                        event = {"token": data} # Raw text tokens
+                    if event.get("done"):
+                        final_data = {k: v for k, v in event.items() if k != "done"}
+                        break
+                    if event.get("token"):
+                        tokens.append(event["token"])
+                        yield "token", event["token"]
+                final_data.setdefault("response", "".join(tokens))
+                yield "final", final_data
+            else:
+                for chunk in r.iter_content(chunk_size=None, decode_unicode=True):
+                    if chunk:
+                        tokens.append(chunk)
+                        yield "token", chunk
+                yield "final", {"response": "".join(tokens)}
+
+    def close(self):
+        self.session.close()
+
+
+@functools.lru_cache(maxsize=16)
+def _shared_client(base_url, pool_size, gzip_requests, timeouts):
+    return BackendClient(base_url, pool_size=pool_size, gzip_requests=gzip_requests, timeouts=dict(timeouts))
+
+
+def get_shared_client(settings):
+    """One client per URL and settings for the whole process, so pages and background jobs share a pool.
+
+    settings is a JSON-friendly dict: {"base_url", "pool_size", "gzip_requests", "timeouts": {endpoint: [connect, read]}}.
+    """
+    timeouts = tuple(sorted((endpoint, tuple(timeout)) for endpoint, timeout in settings.get("timeouts", {}).items()))
+    return _shared_client(settings["base_url"], settings.get("pool_size", 10), settings.get("gzip_requests", False), timeouts)
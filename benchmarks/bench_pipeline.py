@@ -0,0 +1,361 @@
+"""Load test of the parse -> extract -> summarise -> progression -> chat pipeline against the local mock backend.
+
+    python benchmarks/bench_pipeline.py [--patients 20] [--notes 30] [--latency 0.05] [--error-rate 0.02]
+    python benchmarks/bench_pipeline.py --apptest            # also drive streamlit_app.py headlessly
+    python benchmarks/bench_pipeline.py --save baseline.json
+    python benchmarks/bench_pipeline.py --baseline baseline.json --tolerance 0.25   # exits 1 on a regression
+
+Every stage goes through the same code the app runs: DocumentParser, JobManager with the extraction
+and summary handlers, the pooled BackendClient and its streaming chat. Reports throughput, p50/p99
+latency and peak memory per stage, as the RSS growth above the stage's start with the parser workers
+included. Caches and the job table go to a temporary directory unless ONCOTRACK_CACHE_DIR is set.
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Before the project modules are imported, as they read it at import time
+os.environ.setdefault("ONCOTRACK_CACHE_DIR", tempfile.mkdtemp(prefix="oncotrack-bench-"))
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import pandas as pd  # noqa: E402
+
+from backend_client import get_shared_client  # noqa: E402
+from benchmarks.mock_backend import MockBackend  # noqa: E402
+from benchmarks.synthetic_charts import synthetic_patient_charts  # noqa: E402
+from extraction_cache import ExtractionCache  # noqa: E402
+from features_table import FeaturesTable  # noqa: E402
+from ingestion import DocumentParser  # noqa: E402
+from job_manager import ACTIVE_STATUSES, JobManager  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from pipeline import run_extraction_job, run_summary_job  # noqa: E402
+from progression import ProgressionEngine  # noqa: E402
+from summary_index import unique_feature_rows  # noqa: E402
+
+# Metric stages whose latency represents each benchmark stage, first recorded one wins
+LATENCY_STAGES = {
+    "parse": ["parse.mammoth"],
+    "extract": ["http.extract_batch", "http.extract"],
+    "extract (cache hit)": ["http.index_notes", "http.extract_batch", "http.extract"],
+    "summarise": ["http.summarise_features_batch", "http.summarise_features"],
+    "chat": ["chat.time_to_first_token"],
+    "app": ["app.script_run"],
+}
+# Report fields where a higher number is a regression
+LOWER_IS_BETTER = ("p50_ms", "p99_ms", "peak_mb")
+
+
+def rss_bytes(pid="self"):
+    # Resident set size from /proc (Linux); 0 for a process that has just exited
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class RSSSampler:
+    """Samples the RSS of this process plus its live children (the parser pool) on a thread.
+
+    peak_mb is the stage's own high-water mark above the RSS it started with, unlike ru_maxrss,
+    which only ever reports the peak of everything the process has run so far.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _total(self):
+        return rss_bytes() + sum(rss_bytes(child.pid) for child in multiprocessing.active_children())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._total())
+
+    def __enter__(self):
+        self.baseline = self.peak = self._total()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._total())
+
+    @property
+    def peak_mb(self):
+        return max(0, self.peak - self.baseline) / (1024 * 1024)
+
+
+def run_stage(name, fn, trace_memory):
+    """Runs fn() -> (items, errors) and returns the stage's report row."""
+    METRICS.reset()
+    if trace_memory:
+        tracemalloc.start()
+        started = time.perf_counter()
+        items, errors = fn()
+        seconds = time.perf_counter() - started
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    else:
+        with RSSSampler() as sampler:
+            started = time.perf_counter()
+            items, errors = fn()
+            seconds = time.perf_counter() - started
+        peak_mb = sampler.peak_mb
+
+    stages = METRICS.snapshot()["stages"]
+    latency = next((stages[stage] for stage in LATENCY_STAGES.get(name, []) if stage in stages), None)
+    return {
+        "stage": name,
+        "items": items,
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": items / seconds if seconds else 0.0,
+        "p50_ms": latency["p50_seconds"] * 1000 if latency else None,
+        "p99_ms": latency["p99_seconds"] * 1000 if latency else None,
+        "peak_mb": peak_mb,
+    }
+
+
+def wait_for_job(job_manager, job_id, poll_seconds=0.02):
+    while True:
+        job = job_manager.status(job_id)
+        if job["status"] not in ACTIVE_STATUSES:
+            return job
+        time.sleep(poll_seconds)
+
+
+def run_job(job_manager, kind, params, payloads, options):
+    job = wait_for_job(job_manager, job_manager.submit(kind, owner=params["session_id"], params=params, payloads=payloads, options=options))
+    if job["status"] != "done":
+        sys.exit(f"{kind} job {job['status']}: {job['error']}")
+    return job_manager.results(job["id"])
+
+
+def drive_app(server_url, features_df, chat_turns, timeout):
+    """Runs streamlit_app.py under AppTest: Summary page on the extracted features, then chat turns.
+
+    AppTest can't feed st.file_uploader, so the app starts from the features the extract stage produced.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def timed_run(at):
+        with METRICS.timer("app.script_run"):
+            at.run(timeout=timeout)
+        if at.exception:
+            sys.exit(f"App raised: {at.exception[0].message}")
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "streamlit_app.py"), default_timeout=timeout)
+    timed_run(at)
+    at.text_input(key="kaggle-server-url").set_value(server_url)
+    at.selectbox(key="tts-engine").set_value("Off")
+    navigation = next(selectbox for selectbox in at.selectbox if selectbox.label == "Navigation")
+    navigation.set_value("📝 Summary")
+    at.session_state["edited_responses"] = features_df
+    timed_run(at)
+
+    at.button(key="generate_summaries_btn_0").click()
+    timed_run(at)
+    deadline = time.time() + timeout
+    while at.session_state.summary_loading: # Each rerun syncs the job, as a user's browser would
+        if time.time() > deadline:
+            sys.exit("Summaries did not finish within the timeout")
+        time.sleep(0.1)
+        timed_run(at)
+    summaries = at.session_state.generated_summaries_list
+    errors = sum(1 for item in summaries if "summary" not in item)
+
+    navigation = next(selectbox for selectbox in at.selectbox if selectbox.label == "Navigation")
+    navigation.set_value("💬 Chat with AI")
+    timed_run(at)
+    for turn in range(chat_turns):
+        at.chat_input[0].set_value(f"How has the lesion changed by visit {turn + 1}?")
+        timed_run(at)
+        if at.session_state.messages[-1]["content"].startswith("⚠️"):
+            errors += 1
+    return len(summaries) + chat_turns, errors
+
+
+def print_report(rows):
+    print(f"{'stage':<20} {'items':>7} {'errors':>7} {'seconds':>9} {'items/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'peak (MB)':>10}")
+    for row in rows:
+        p50 = f"{row['p50_ms']:.1f}" if row["p50_ms"] is not None else "-"
+        p99 = f"{row['p99_ms']:.1f}" if row["p99_ms"] is not None else "-"
+        print(f"{row['stage']:<20} {row['items']:>7} {row['errors']:>7} {row['seconds']:>9.3f} {row['throughput']:>9.1f} {p50:>9} {p99:>9} {row['peak_mb']:>10.1f}")
+
+
+def compare_to_baseline(rows, baseline_rows, tolerance):
+    # Lower throughput or higher latency/memory than the baseline by more than tolerance is a regression
+    baseline = {row["stage"]: row for row in baseline_rows}
+    regressions = []
+    for row in rows:
+        base = baseline.get(row["stage"])
+        if base is None:
+            continue
+        if base["throughput"] and row["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{row['stage']}: throughput {row['throughput']:.1f}/s vs {base['throughput']:.1f}/s")
+        for field in LOWER_IS_BETTER:
+            if base.get(field) and row.get(field) is not None and row[field] > base[field] * (1 + tolerance):
+                regressions.append(f"{row['stage']}: {field} {row[field]:.1f} vs {base[field]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=20, help="synthetic .docx charts")
+    parser.add_argument("--notes", type=int, default=30, help="progress notes per chart")
+    parser.add_argument("--sentences", type=int, default=8, help="sentences per progress note")
+    parser.add_argument("--latency", type=float, default=0.05, help="mock backend seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with a 503")
+    parser.add_argument("--num-features", type=int, default=8, help="fields per extracted feature set")
+    parser.add_argument("--summary-words", type=int, default=60)
+    parser.add_argument("--no-batch", action="store_true", help="mock backend without the batch endpoints")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--parse-workers", type=int, default=None)
+    parser.add_argument("--chat-turns", type=int, default=20)
+    parser.add_argument("--chat-concurrency", type=int, default=4)
+    parser.add_argument("--apptest", action="store_true", help="also drive streamlit_app.py with Streamlit's AppTest")
+    parser.add_argument("--app-timeout", type=float, default=120)
+    parser.add_argument("--tracemalloc", action="store_true", help="peak Python heap per stage instead of sampled RSS growth (slower, misses the parser workers)")
+    parser.add_argument("--save", help="write the report as JSON")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression against the baseline")
+    parser.add_argument("--metrics", help="also export the last stage's metrics (.prom for Prometheus text, else JSON lines)")
+    args = parser.parse_args()
+
+    cache_dir = os.environ["ONCOTRACK_CACHE_DIR"]
+    print(f"Generating {args.patients} charts x {args.notes} notes; caches in {cache_dir}")
+    charts = synthetic_patient_charts(args.patients, args.notes, args.sentences)
+
+    backend = MockBackend(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        num_features=args.num_features, summary_words=args.summary_words, batch=not args.no_batch,
+    )
+    backend.start()
+    client_settings = {"base_url": backend.url, "pool_size": max(10, args.max_in_flight), "gzip_requests": False, "timeouts": {}}
+    job_options = {
+        "client": client_settings,
+        "batch_size": args.batch_size,
+        "max_in_flight": args.max_in_flight,
+        "max_retries": args.max_retries,
+        "retry_backoff": 0.1,
+    }
+    extraction_cache = ExtractionCache()
+    job_manager = JobManager(handlers={
+        "extract": functools.partial(run_extraction_job, extraction_cache=extraction_cache),
+        "summarise": run_summary_job,
+    })
+    document_parser = DocumentParser(max_workers=args.parse_workers)
+    rows = []
+    state = {}
+
+    def parse_stage():
+        parsed = document_parser.parse_many(charts)
+        document_parser.close() # The workers were sampled while alive; closing them keeps later stages' numbers clean
+        state["payloads"] = []
+        for name, result in parsed.items():
+            if not isinstance(result, Exception):
+                for record in result["note_records"]:
+                    note_date = record.date.isoformat() if record.date else None
+                    state["payloads"].append({"order": len(state["payloads"]) + 1, "file_name": name, "note": record.text, "note_date": note_date})
+        return len(charts), sum(1 for result in parsed.values() if isinstance(result, Exception))
+
+    def extract_stage():
+        params = {"session_id": str(uuid.uuid4()), "model_name": "mock-model", "server_url": backend.url}
+        results = run_job(job_manager, "extract", params, state["payloads"], job_options)
+        state["results"] = results
+        state["responses"] = [result["response"] for result in results if isinstance(result["response"], dict)]
+        return len(results), len(results) - len(state["responses"])
+
+    def summary_stage():
+        unique_df, _ = unique_feature_rows(pd.DataFrame(state["responses"]))
+        params = {"session_id": str(uuid.uuid4()), "server_url": backend.url}
+        results = run_job(job_manager, "summarise", params, unique_df.to_dict(orient="records"), job_options)
+        return len(results), sum(1 for item in results if "summary" not in item)
+
+    def progression_stage():
+        # What the Progression page builds once per finished extraction, plus one chart of each kind
+        features_table = FeaturesTable(state["results"])
+        progression = ProgressionEngine(features_table)
+        for feature in progression.numeric_features[:1]:
+            progression.cohort_plot(feature)
+            progression.trend_plot(feature)
+            progression.feature_summary(feature)
+        for patient in progression.patients[:1]:
+            progression.patient_plot(patient, progression.numeric_features[:1])
+            progression.category_transitions(patient)
+        return len(features_table), progression.undated_notes
+
+    def chat_stage():
+        client = get_shared_client(client_settings)
+        session_id = str(uuid.uuid4())
+
+        def chat_turn(turn):
+            started = time.perf_counter()
+            ttft = None
+            for event_type, _ in client.chat_stream({"text": f"Summarise the progression at visit {turn + 1}"}, session_id):
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+            METRICS.record("chat.time_to_first_token", ttft)
+
+        errors = 0
+        with ThreadPoolExecutor(max_workers=args.chat_concurrency) as executor:
+            for future in [executor.submit(chat_turn, turn) for turn in range(args.chat_turns)]:
+                try:
+                    future.result()
+                except Exception as err:
+                    print(f"Chat turn failed: {err}")
+                    errors += 1
+        return args.chat_turns, errors
+
+    try:
+        rows.append(run_stage("parse", parse_stage, args.tracemalloc))
+        rows.append(run_stage("extract", extract_stage, args.tracemalloc))
+        rows.append(run_stage("extract (cache hit)", extract_stage, args.tracemalloc)) # Same notes, new session
+        rows.append(run_stage("summarise", summary_stage, args.tracemalloc))
+        rows.append(run_stage("progression", progression_stage, args.tracemalloc))
+        rows.append(run_stage("chat", chat_stage, args.tracemalloc))
+        if args.apptest:
+            features_df = pd.DataFrame(state["responses"])
+            rows.append(run_stage("app", lambda: drive_app(backend.url, features_df, min(args.chat_turns, 5), args.app_timeout), args.tracemalloc))
+        if args.metrics:
+            METRICS.export(args.metrics, "prometheus" if args.metrics.endswith(".prom") else "jsonl")
+    finally:
+        backend.stop()
+        document_parser.close()
+
+    print(f"Mock backend served {backend.requests_served} requests")
+    print_report(rows)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(rows, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(rows, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
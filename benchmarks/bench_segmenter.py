@@ -0,0 +1,55 @@
+"""Compares the streaming progress-note segmenter with the original lookahead regex.
+
+    python benchmarks/bench_segmenter.py [--sizes 10 100 1000 5000] [--repeat 3]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_charts import synthetic_chart_text  # noqa: E402
+from segmenter import iter_progress_notes, segment_progress_notes  # noqa: E402
+
+# The regex the Upload page used before segmenter.py
+LEGACY_PATTERN = re.compile(
+    r"Date\s*:\s*\d{2}\/\d{2}\/\d{4}\s*ProgressNotes\s*:(?:.*?(?=Date\s*:\s*\d{2}\/\d{2}\/\d{4}\s*ProgressNotes\s*:|Signed By|$))",
+    flags=re.DOTALL
+)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000], help="notes per synthetic chart")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-chars", type=int, default=64 * 1024, help="chunk size for the streaming run")
+    parser.add_argument("--unsigned", action="store_true", help="drop the Signed By lines, the regex's worst case")
+    args = parser.parse_args()
+
+    print(f"{'notes':>7} {'chars':>11} {'regex (s)':>10} {'segmenter (s)':>14} {'streamed (s)':>13} {'speedup':>8}")
+    for size in args.sizes:
+        text = synthetic_chart_text(size)
+        if args.unsigned:
+            text = re.sub(r"Signed By.*\n", "", text)
+        regex_seconds, expected = best_of(lambda: LEGACY_PATTERN.findall(text), args.repeat)
+        segment_seconds, notes = best_of(lambda: segment_progress_notes(text), args.repeat)
+        chunks = [text[i:i + args.chunk_chars] for i in range(0, len(text), args.chunk_chars)]
+        stream_seconds, streamed = best_of(lambda: list(iter_progress_notes(chunks)), args.repeat)
+        if [note.text for note in notes] != expected or [note.text for note in streamed] != expected:
+            sys.exit(f"Segmenter output differs from the regex for {size} notes")
+        print(f"{size:>7} {len(text):>11} {regex_seconds:>10.4f} {segment_seconds:>14.4f} {stream_seconds:>13.4f} {regex_seconds / segment_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""A local stand-in for the Kaggle/ngrok inference server, for load tests and offline development.
+
+    python benchmarks/mock_backend.py [--port 8000] [--latency 0.2] [--jitter 0.05] [--error-rate 0.02]
+
+Implements /capabilities, /extract, /extract_batch, /index_notes, /summarise_features, /summarise_features_batch
+and /chat_interaction (JSON, binary audio and streamed SSE replies) with the same request and
+response shapes the app uses. Responses are made up but deterministic per input, so repeated
+notes give identical features, like the real model.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+DATE_PATTERN = re.compile(r"Date\s*:\s*(\d{2}\/\d{2}\/\d{4})")
+SIZE_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*cm")
+
+SITES = ["Buccal mucosa", "Lateral border of tongue", "Floor of mouth", "Gingivobuccal sulcus", "Retromolar trigone"]
+STAGES = ["T1N0M0", "T2N0M0", "T2N1M0", "T3N1M0", "T4aN2M0"]
+TREATMENTS = ["Observation", "Surgery", "Radiotherapy", "Chemotherapy", "Chemoradiotherapy"]
+WORDS = "patient lesion ulcer margin biopsy node tongue mucosa therapy response stable progression regression review".split()
+
+
+class MockBackend:
+    """Threaded HTTP server answering like the inference server.
+
+    latency/jitter: seconds added to every request (uniform jitter either way).
+    error_rate: fraction of requests answered with a 503, which the app treats as retryable.
+    num_features/summary_words/reply_words: payload sizes of extract, summary and chat responses.
+    batch/audio: whether /capabilities advertises the batch endpoints and binary audio uploads.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, jitter=0.0, error_rate=0.0,
+                 num_features=8, summary_words=60, reply_words=40, token_delay=0.005, batch=True, audio=True, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.num_features = num_features
+        self.summary_words = summary_words
+        self.reply_words = reply_words
+        self.token_delay = token_delay
+        self.batch = batch
+        self.audio = audio
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests_served = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="mock-backend", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _draw(self):
+        # (delay, fail) for one request; one shared RNG so a seed reproduces a whole run
+        with self._rng_lock:
+            self.requests_served += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            return delay, self._rng.random() < self.error_rate
+
+    def capabilities(self):
+        capabilities = {}
+        if self.batch:
+            capabilities["batch_endpoints"] = ["extract", "summarise_features"]
+        if self.audio:
+            capabilities["audio_upload_types"] = ["audio/wav", "audio/flac"]
+        capabilities["index_notes"] = True
+        return capabilities
+
+    def extract_features(self, text):
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        date_match = DATE_PATTERN.search(text)
+        size_match = SIZE_PATTERN.search(text)
+        features = {
+            "Date": date_match.group(1) if date_match else None,
+            "Site": rng.choice(SITES),
+            "Tumour Size (cm)": float(size_match.group(1)) if size_match else None,
+            "TNM Stage": rng.choice(STAGES),
+            "Treatment": rng.choice(TREATMENTS),
+            "Tobacco Use": "Yes" if "tobacco" in text.lower() else "No",
+        }
+        for i in range(max(0, self.num_features - len(features))): # Padding to reach the requested payload size
+            features[f"Finding {i + 1}"] = rng.choice(WORDS)
+        return features
+
+    def summarise_features(self, features):
+        rng = random.Random(json.dumps(features, sort_keys=True, default=str))
+        return {"summary": " ".join(rng.choice(WORDS) for _ in range(self.summary_words)).capitalize() + "."}
+
+    def chat_reply(self, text):
+        rng = random.Random(text)
+        return " ".join(rng.choice(WORDS) for _ in range(self.reply_words)).capitalize() + "."
+
+    def _handler_class(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the tunnel
+
+            def log_message(self, format, *args):
+                pass # Keeps benchmark output readable
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return body
+
+            def do_GET(self):
+                if urlparse(self.path).path == "/capabilities":
+                    self._send_json(200, backend.capabilities())
+                else:
+                    self._send_json(404, {"error": "Not found"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                body = self._read_body()
+                delay, fail = backend._draw()
+                time.sleep(delay)
+                if fail:
+                    self._send_json(503, {"error": "Mock backend: injected failure"})
+                    return
+                try:
+                    if url.path == "/extract":
+                        self._send_json(200, {"response": backend.extract_features(json.loads(body)["text"])})
+                    elif url.path == "/extract_batch" and backend.batch:
+                        texts = json.loads(body)["texts"]
+                        self._send_json(200, {"responses": [backend.extract_features(text) for text in texts]})
+                    elif url.path == "/index_notes":
+                        self._send_json(200, {"indexed": len(json.loads(body)["texts"])})
+                    elif url.path == "/summarise_features":
+                        self._send_json(200, backend.summarise_features(json.loads(body)))
+                    elif url.path == "/summarise_features_batch" and backend.batch:
+                        features_list = json.loads(body)["features"]
+                        self._send_json(200, {"results": [backend.summarise_features(features) for features in features_list]})
+                    elif url.path == "/chat_interaction":
+                        self._chat(body, query)
+                    else:
+                        self._send_json(404, {"error": "Not found"})
+                except (ValueError, KeyError) as err:
+                    self._send_json(400, {"error": f"Bad request: {err}"})
+
+            def _chat(self, body, query):
+                content_type = self.headers.get("Content-Type", "")
+                if content_type.startswith("audio/"):
+                    prompt = f"audio message of {len(body)} bytes"
+                    response_data = {"input_type": "audio", "transcribed_text": prompt, "translated_text": prompt, "detected_language": "en"}
+                else:
+                    payload = json.loads(body)
+                    if "audio" in payload:
+                        prompt = f"audio message of {len(payload['audio'])} base64 chars"
+                        response_data = {"input_type": "audio", "transcribed_text": prompt, "translated_text": prompt, "detected_language": "en"}
+                    else:
+                        prompt = payload["text"]
+                        response_data = {"input_type": "text"}
+                reply = backend.chat_reply(prompt)
+
+                if query.get("stream") != ["true"]:
+                    response_data["response"] = reply
+                    self._send_json(200, response_data)
+                    return
+                # SSE over chunked transfer encoding, one token per event
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                events = [{"token": token + " "} for token in reply.split(" ")]
+                events.append({"done": True, "response": reply, **response_data})
+                for event in events:
+                    data = f"data: {json.dumps(event)}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+                    if backend.token_delay:
+                        time.sleep(backend.token_delay)
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--num-features", type=int, default=8, help="fields per extracted feature set")
+    parser.add_argument("--summary-words", type=int, default=60)
+    parser.add_argument("--reply-words", type=int, default=40)
+    parser.add_argument("--no-batch", action="store_true", help="don't advertise the batch endpoints")
+    args = parser.parse_args()
+
+    backend = MockBackend(
+        host=args.host, port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        num_features=args.num_features, summary_words=args.summary_words, reply_words=args.reply_words, batch=not args.no_batch,
+    )
+    print(f"Mock backend listening on {backend.url} (Ctrl+C to stop)")
+    try:
+        backend.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
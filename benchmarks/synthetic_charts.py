@@ -0,0 +1,84 @@
+import random
+import zipfile
+from datetime import date, timedelta
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+FINDINGS = [
+    "Patient complains of burning sensation in the buccal mucosa.",
+    "Ulcer on the lateral border of the tongue measuring {size} cm.",
+    "Leukoplakia patch noted on the left buccal mucosa.",
+    "Submandibular lymph node palpable, {size} cm, firm and fixed.",
+    "Mouth opening restricted to {size} cm.",
+    "Biopsy report: moderately differentiated squamous cell carcinoma.",
+    "Patient is a chronic tobacco chewer for {years} years.",
+    "No dysphagia or odynophagia reported.",
+    "Completed cycle {cycle} of chemotherapy, tolerated well.",
+    "Radiotherapy fraction {cycle} delivered as planned.",
+]
+
+
+def synthetic_chart_text(num_notes, sentences_per_note=8, seed=0, start=date(2022, 1, 3)):
+    """A chart in the exported layout: "Date : dd/mm/yyyy ProgressNotes :" blocks, each followed by a Signed By line."""
+    rng = random.Random(seed)
+    lines = ["Patient Name : Synthetic Patient", "Hospital No : 000000", ""]
+    visit = start
+    for _ in range(num_notes):
+        visit += timedelta(days=rng.randint(7, 45))
+        lines.append(f"Date : {visit:%d/%m/%Y}\tProgressNotes :")
+        for _ in range(sentences_per_note):
+            lines.append(rng.choice(FINDINGS).format(size=rng.randint(1, 6), years=rng.randint(2, 30), cycle=rng.randint(1, 6)))
+        lines.append(f"Signed By Dr. Resident {rng.randint(1, 20)}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+PACKAGE_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '</Relationships>'
+)
+DOCUMENT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships"></Relationships>'
+)
+
+
+def _docx_paragraph(line):
+    # Tabs are their own run element in WordprocessingML
+    runs = "<w:tab/>".join(f'<w:t xml:space="preserve">{escape(part)}</w:t>' for part in line.split("\t"))
+    return f"<w:p><w:r>{runs}</w:r></w:p>"
+
+
+def synthetic_chart_docx(num_notes, sentences_per_note=8, seed=0, start=date(2022, 1, 3)):
+    """synthetic_chart_text() as .docx bytes, one paragraph per line, built with the stdlib only."""
+    body = "".join(_docx_paragraph(line) for line in synthetic_chart_text(num_notes, sentences_per_note, seed, start).split("\n"))
+    document_xml = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", CONTENT_TYPES_XML)
+        docx.writestr("_rels/.rels", PACKAGE_RELS_XML)
+        docx.writestr("word/_rels/document.xml.rels", DOCUMENT_RELS_XML)
+        docx.writestr("word/document.xml", document_xml)
+    return buffer.getvalue()
+
+
+def synthetic_patient_charts(num_patients, notes_per_patient, sentences_per_note=8, seed=0):
+    """[(file name, .docx bytes)] for a cohort, each patient with their own visit history."""
+    return [
+        (f"patient_{i + 1:04d}.docx", synthetic_chart_docx(notes_per_patient, sentences_per_note, seed=seed + i))
+        for i in range(num_patients)
+    ]
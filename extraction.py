@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from metrics import METRICS
+
+
+def call_with_retry(fn, *args, retries=2, backoff=1.0, should_retry=None, **kwargs):
+    # Retries fn on exceptions accepted by should_retry, sleeping backoff, 2*backoff, 4*backoff...
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or (should_retry is not None and not should_retry(e)):
+                raise
+            METRICS.increment("http.retries")
+            time.sleep(backoff * (2 ** attempt))
+            attempt += 1
+
+
+def chunked(items, size):
+    # Splits items into consecutive lists of at most size elements
+    size = max(1, int(size))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_concurrently(jobs, worker_fn, max_in_flight=4, retries=2, backoff=1.0, should_retry=None):
+    """Runs worker_fn(job) for every job with at most max_in_flight calls in flight.
+
+    Yields (job, result, error) tuples in completion order so the caller can update
+    the UI from the main script thread (Streamlit elements can't be touched from workers).
+    """
+    if not jobs:
+        return
+    max_in_flight = max(1, int(max_in_flight))
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(jobs))) as pool:
+        futures = {
+            pool.submit(call_with_retry, worker_fn, job, retries=retries, backoff=backoff, should_retry=should_retry): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                yield job, future.result(), None
+            except Exception as e:
+                yield job, None, e
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import METRICS
+
+DEFAULT_CACHE_DIR = os.environ.get("ONCOTRACK_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+
+
+def normalize_note(text):
+    # Whitespace differences between re-exports of the same chart shouldn't miss the cache
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def note_cache_key(text, model_name):
+    digest = hashlib.sha256()
+    digest.update((model_name or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_note(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Disk-backed (SQLite) store of /extract results keyed by note text + model name.
+
+    Entries older than ttl_seconds are ignored and purged; when more than max_entries
+    are stored the least recently used ones are evicted.
+
+    The backend adds every note it extracts to that session's vector store, which chat relies on,
+    so the cache also records which sessions each note has been sent under (see indexed_for).
+    """
+
+    def __init__(self, path=None, max_entries=50000, ttl_seconds=30 * 24 * 3600):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "extraction_cache.sqlite3")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_results ("
+                " key TEXT PRIMARY KEY,"
+                " model_name TEXT,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_extraction_results_accessed ON extraction_results (accessed_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS indexed_sessions ("
+                " key TEXT NOT NULL,"
+                " session_id TEXT NOT NULL,"
+                " indexed_at REAL NOT NULL,"
+                " PRIMARY KEY (key, session_id))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn: # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, text, model_name):
+        key = note_cache_key(text, model_name)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT response, created_at FROM extraction_results WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                self.misses += 1
+                METRICS.increment("cache.extraction.miss")
+                return None
+            conn.execute("UPDATE extraction_results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        METRICS.increment("cache.extraction.hit")
+        return json.loads(row[0])
+
+    def put(self, text, model_name, response):
+        key = note_cache_key(text, model_name)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extraction_results (key, model_name, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, json.dumps(response), now, now),
+            )
+            self._evict(conn, now)
+
+    def indexed_for(self, text, model_name, session_id):
+        # True when the backend has already seen this note under session_id (so its vector store has it)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM indexed_sessions WHERE key = ? AND session_id = ?",
+                (note_cache_key(text, model_name), session_id),
+            ).fetchone()
+        return row is not None
+
+    def mark_indexed(self, text, model_name, session_id):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO indexed_sessions (key, session_id, indexed_at) VALUES (?, ?, ?)",
+                (note_cache_key(text, model_name), session_id, time.time()),
+            )
+
+    def _evict(self, conn, now):
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM extraction_results WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute("DELETE FROM indexed_sessions WHERE indexed_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            conn.execute(
+                "DELETE FROM extraction_results WHERE key IN ("
+                " SELECT key FROM extraction_results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM extraction_results")
+            conn.execute("DELETE FROM indexed_sessions")
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM extraction_results").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,127 @@
+import functools
+import json
+from io import BytesIO
+
+import pandas as pd
+
+EXPORT_FORMATS = {"CSV": ("text/csv", "csv"), "Parquet": ("application/vnd.apache.parquet", "parquet")}
+
+
+def parquet_available():
+    try:
+        import pyarrow # noqa: F401 - optional dependency (installed with streamlit)
+        return True
+    except ImportError:
+        return False
+
+
+def type_feature_columns(df, max_category_ratio=0.5):
+    # Text columns that repeat a lot (sites, stages, treatments...) are stored as categories;
+    # numbers keep their numpy dtype and mixed or nested values stay plain objects
+    # (text columns are object dtype on older pandas and "str" dtype from pandas 3 on)
+    for column in df.columns:
+        series = df[column]
+        if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+            continue
+        non_null = series.dropna()
+        if non_null.empty or pd.api.types.infer_dtype(non_null, skipna=True) != "string":
+            continue
+        if non_null.nunique() <= max(1, len(non_null) * max_category_ratio):
+            df[column] = series.astype("category")
+    return df
+
+
+def _export_safe(df):
+    # Parquet needs one type per column: dicts/lists become JSON, other mixed values become text.
+    # Category and str columns already have one type and are written as they are.
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_object_dtype(df[column]):
+            df[column] = df[column].map(
+                lambda value: None if value is None or value != value
+                else json.dumps(value, default=str) if isinstance(value, (dict, list))
+                else str(value)
+            )
+    return df
+
+
+class FeaturesTable:
+    """A finished extraction job's results as one typed, columnar frame, built once per job.
+
+    `features` has one row per successfully extracted note, indexed by the note's upload order,
+    and only the model's feature columns, since that is what the Summary page hashes and sends.
+    `file_names` and `note_dates` are aligned with it and `errors` lists the notes whose extraction failed.
+    The last filter and each export are memoized on the table, so reruns only slice the frame.
+    """
+
+    def __init__(self, responses):
+        ordered = sorted(responses, key=lambda resp: resp["order"])
+        extracted = [resp for resp in ordered if isinstance(resp["response"], dict)]
+        failed = [resp for resp in ordered if not isinstance(resp["response"], dict)]
+
+        index = pd.Index([resp["order"] for resp in extracted], name="order", dtype="int64")
+        self.features = type_feature_columns(pd.DataFrame([resp["response"] for resp in extracted], index=index))
+        self.file_names = pd.Series([resp["file_name"] for resp in extracted], index=index, name="file_name", dtype="category")
+        # Date from the note's "Date : dd/mm/yyyy" header; missing for unreadable dates or older jobs
+        self.note_dates = pd.to_datetime(pd.Series([resp.get("note_date") for resp in extracted], index=index, name="note_date", dtype=object), errors="coerce")
+        self.errors = pd.DataFrame({
+            "order": pd.Series([resp["order"] for resp in failed], dtype="int64"),
+            "file_name": pd.Series([resp["file_name"] for resp in failed], dtype=object),
+            "error": pd.Series([str(resp["response"]) for resp in failed], dtype=object),
+        })
+        self._exports = {}
+        self._last_filter = None
+
+    def __len__(self):
+        return len(self.features)
+
+    @functools.cached_property
+    def _search_text(self):
+        # Every feature value of a row in one lowercase string, built once so text filters are a single vectorized scan
+        text = self.file_names.astype(str).str.lower()
+        for column in self.features.columns:
+            text = text + "\x1f" + self.features[column].astype(str).str.lower()
+        return text
+
+    def file_options(self):
+        return sorted(set(self.file_names.cat.categories) | set(self.errors["file_name"]))
+
+    def filtered_index(self, file_names=(), query=""):
+        """Order numbers of the rows matching the file and text filters; the last result is memoized."""
+        key = (tuple(sorted(file_names)), query.strip().lower())
+        if self._last_filter is None or self._last_filter[0] != key:
+            mask = pd.Series(True, index=self.features.index)
+            if key[0]:
+                mask &= self.file_names.isin(key[0])
+            if key[1]:
+                mask &= self._search_text.str.contains(key[1], regex=False)
+            self._last_filter = (key, self.features.index[mask.to_numpy()])
+        return self._last_filter[1]
+
+    def rows(self, index, columns=None):
+        # Only the requested rows (e.g. one page) are materialized for display, with file_name and note_date first
+        features = self.features.loc[index, list(columns) if columns else self.features.columns]
+        return pd.concat([self.file_names.loc[index], self.note_dates.loc[index], features], axis=1)
+
+    def error_summary(self):
+        # One row per distinct error message instead of one warning per note
+        if self.errors.empty:
+            return self.errors
+        return (
+            self.errors.groupby("error", sort=False)
+            .agg(notes=("order", "size"), first_note=("order", "min"), files=("file_name", lambda names: ", ".join(sorted(set(names)))))
+            .sort_values("notes", ascending=False)
+            .reset_index()
+        )
+
+    def export(self, fmt):
+        """The whole table (order, file name, note date and features) as CSV or Parquet bytes, serialized once per format."""
+        if fmt not in self._exports:
+            frame = pd.concat([self.file_names, self.note_dates, self.features], axis=1).reset_index()
+            buffer = BytesIO()
+            if fmt == "Parquet":
+                _export_safe(frame).to_parquet(buffer, index=False)
+            else:
+                frame.to_csv(buffer, index=False, chunksize=10000)
+            self._exports[fmt] = buffer.getvalue()
+        return self._exports[fmt]
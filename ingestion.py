@@ -0,0 +1,126 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import mammoth
+
+from metrics import METRICS
+from segmenter import segment_progress_notes
+
+
+def clean_text(text):
+    cleaned_text = re.sub(r'(\n){3,}', "\n", text)
+    cleaned_text = re.sub(r'(\t)+', " ", cleaned_text)
+    cleaned_text = re.sub(r'(\r\n)+', "\n", cleaned_text)
+    return cleaned_text
+
+
+def parse_docx(file_bytes):
+    # Runs in a worker process, so it takes and returns plain picklable data
+    # Timings are returned with the result because worker processes can't update the parent's metrics
+    started = time.perf_counter()
+    result = mammoth.extract_raw_text(BytesIO(file_bytes))
+    extracted = time.perf_counter()
+    cleaned_text = clean_text(result.value)
+    cleaned = time.perf_counter()
+    note_records = segment_progress_notes(cleaned_text)
+    segmented = time.perf_counter()
+    return {
+        "timings": {"parse.mammoth": extracted - started, "parse.clean": cleaned - extracted, "parse.segment": segmented - cleaned},
+        "cleaned_text": cleaned_text,
+        "progress_notes": [note.text for note in note_records],
+        "note_records": note_records, # ProgressNote(date, date_text, offset, text)
+    }
+
+
+def content_hash(file_bytes):
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+class DocumentParser:
+    """Parses .docx uploads in a process pool, memoizing results by file content hash.
+
+    Re-running the script with the same uploads costs nothing, and adding one more
+    document only parses that document.
+    """
+
+    def __init__(self, max_workers=None, max_cached_documents=2000):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_cached_documents = max_cached_documents
+        self._parsed = OrderedDict() # content hash -> parse_docx() result
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: forking the multi-threaded Streamlit server can deadlock the children
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _remember(self, digest, parsed):
+        with self._lock:
+            self._parsed[digest] = parsed
+            self._parsed.move_to_end(digest)
+            while len(self._parsed) > self.max_cached_documents:
+                self._parsed.popitem(last=False)
+
+    def parse_many(self, documents):
+        """documents: list of (name, bytes). Returns {name: parsed dict or Exception}."""
+        results = {}
+        to_parse = {} # content hash -> (bytes, [names]); identical uploads are parsed once
+        for name, file_bytes in documents:
+            digest = content_hash(file_bytes)
+            with self._lock:
+                parsed = self._parsed.get(digest)
+                if parsed is not None:
+                    self._parsed.move_to_end(digest)
+            if parsed is not None:
+                METRICS.increment("cache.parse.hit")
+                results[name] = parsed
+            else:
+                METRICS.increment("cache.parse.miss")
+                to_parse.setdefault(digest, (file_bytes, []))[1].append(name)
+
+        if len(to_parse) == 1 or self.max_workers == 1:
+            # Not worth the process start-up cost
+            outcomes = {}
+            for digest, (file_bytes, _) in to_parse.items():
+                try:
+                    outcomes[digest] = parse_docx(file_bytes)
+                except Exception as err:
+                    outcomes[digest] = err
+        else:
+            futures = {digest: self._get_pool().submit(parse_docx, file_bytes) for digest, (file_bytes, _) in to_parse.items()}
+            outcomes = {}
+            for digest, future in futures.items():
+                try:
+                    outcomes[digest] = future.result()
+                except Exception as err:
+                    if isinstance(err, BrokenProcessPool):
+                        self._pool = None # A crashed worker poisons the pool; start a fresh one next time
+                    outcomes[digest] = err
+
+        for digest, outcome in outcomes.items():
+            if isinstance(outcome, Exception):
+                METRICS.record("parse.mammoth", 0.0, error=outcome)
+            else:
+                for stage, seconds in outcome["timings"].items():
+                    METRICS.record(stage, seconds, bytes_received=len(outcome["cleaned_text"]) if stage == "parse.mammoth" else 0)
+                self._remember(digest, outcome)
+            for name in to_parse[digest][1]:
+                results[name] = outcome
+        return results
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from extraction_cache import DEFAULT_CACHE_DIR
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobManager:
+    """Runs extraction/summary jobs on worker threads, independent of Streamlit script reruns.
+
+    Jobs and their items live in a SQLite table. Every finished item is checkpointed as soon
+    as its handler reports it, so a job interrupted by a server restart (or a failure) picks up
+    from the first unfinished item instead of starting over. Submitting the same work twice
+    returns the existing job, which is what lets a rerun re-attach to a run in progress.
+
+    A handler is called as handler(params, options, items, checkpoint, should_stop) where items
+    is a list of (idx, payload) still to do and checkpoint(idx, result) records one result.
+    failed_result maps a kind to a predicate spotting checkpointed results that were errors,
+    which submit(..., retry=True) runs again.
+    """
+
+    def __init__(self, handlers, path=None, num_workers=2, retention_seconds=7 * 24 * 3600, failed_result=None):
+        self.handlers = handlers
+        self.failed_result = failed_result or {}
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite3")
+        self._queue = queue.Queue()
+        self._active = set()
+        self._cancelled = set()
+        self._rerun = set() # Active jobs re-queued (resumed/retried) while their handler was still winding down
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " owner TEXT,"
+                " status TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " options TEXT NOT NULL,"
+                " total INTEGER NOT NULL,"
+                " completed INTEGER NOT NULL DEFAULT 0,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_items ("
+                " job_id TEXT NOT NULL,"
+                " idx INTEGER NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " result TEXT,"
+                " PRIMARY KEY (job_id, idx))"
+            )
+            # Housekeeping: forget old finished jobs
+            expired = time.time() - retention_seconds
+            conn.execute("DELETE FROM job_items WHERE job_id IN (SELECT id FROM jobs WHERE updated_at < ? AND status NOT IN ('queued', 'running'))", (expired,))
+            conn.execute("DELETE FROM jobs WHERE updated_at < ? AND status NOT IN ('queued', 'running')", (expired,))
+            # Jobs that were queued or running when the server stopped are resumed
+            interrupted = [row[0] for row in conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at")]
+        for job_id in interrupted:
+            self._enqueue(job_id)
+        for i in range(num_workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn: # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def job_key(kind, owner, params, payloads):
+        digest = hashlib.sha256(json.dumps([kind, owner, params, payloads], sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()[:32]
+
+    def submit(self, kind, owner, params, payloads, options=None, retry=False):
+        """Queues a job (or re-attaches to the identical one) and returns its id.
+
+        params and payloads identify the work; options (concurrency, batch size...) only tune how it runs.
+        Re-attaching leaves a finished job alone, since reruns submit the same work over and over. With
+        retry (an explicit user action) a cancelled or failed job resumes and a done job re-runs its failed items.
+        """
+        job_id = self.job_key(kind, owner, params, payloads)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is not None and retry and row[0] not in ACTIVE_STATUSES:
+                if row[0] == "done":
+                    self._reset_failed_items(conn, job_id, kind, options)
+                else:
+                    conn.execute("UPDATE jobs SET status = 'queued', error = NULL, options = ?, updated_at = ? WHERE id = ?", (json.dumps(options or {}), now, job_id))
+                    with self._lock:
+                        self._cancelled.discard(job_id)
+            elif row is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, owner, status, params, options, total, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?)",
+                    (job_id, kind, owner, json.dumps(params), json.dumps(options or {}), len(payloads), now, now),
+                )
+                conn.executemany(
+                    "INSERT INTO job_items (job_id, idx, payload) VALUES (?, ?, ?)",
+                    [(job_id, idx, json.dumps(payload, default=str)) for idx, payload in enumerate(payloads)],
+                )
+            else:
+                return job_id # Already known: re-attach
+        self._enqueue(job_id)
+        return job_id
+
+    def _reset_failed_items(self, conn, job_id, kind, options):
+        is_failed = self.failed_result.get(kind)
+        if is_failed is None:
+            return
+        failed = [
+            idx for idx, result in conn.execute("SELECT idx, result FROM job_items WHERE job_id = ? AND result IS NOT NULL", (job_id,))
+            if is_failed(json.loads(result))
+        ]
+        if failed:
+            # Only the failed items are cleared, so the handler runs again for just those
+            conn.executemany("UPDATE job_items SET result = NULL WHERE job_id = ? AND idx = ?", [(job_id, idx) for idx in failed])
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, completed = completed - ?, options = ?, updated_at = ? WHERE id = ?",
+                (len(failed), json.dumps(options or {}), time.time(), job_id),
+            )
+
+    def resume(self, job_id, options=None):
+        # Re-queues a failed or cancelled job; it continues from its last checkpoint rather than starting over
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'queued', error = NULL, options = COALESCE(?, options), updated_at = ? WHERE id = ? AND status IN ('failed', 'cancelled')",
+                (json.dumps(options) if options is not None else None, time.time(), job_id),
+            ).rowcount
+        if updated:
+            with self._lock:
+                self._cancelled.discard(job_id)
+            self._enqueue(job_id)
+
+    def _enqueue(self, job_id):
+        with self._lock:
+            if job_id in self._active:
+                # e.g. Resume right after Cancel: the worker puts it back on the queue once the handler returns
+                self._rerun.add(job_id)
+                return
+            self._active.add(job_id)
+        self._queue.put(job_id)
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, kind, status, total, completed, error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "kind", "status", "total", "completed", "error"), row))
+
+    def results(self, job_id):
+        # Results in submission order; None for items that haven't finished
+        with self._connect() as conn:
+            rows = conn.execute("SELECT result FROM job_items WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()
+        return [json.loads(result) if result is not None else None for (result,) in rows]
+
+    def cancel(self, job_id):
+        with self._lock:
+            self._cancelled.add(job_id)
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status IN ('queued', 'running')", (time.time(), job_id))
+
+    def _set_status(self, job_id, status, error=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?", (status, error, time.time(), job_id))
+
+    def _checkpoint(self, job_id, idx, result):
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE job_items SET result = ? WHERE job_id = ? AND idx = ? AND result IS NULL",
+                (json.dumps(result, default=str), job_id, idx),
+            ).rowcount
+            conn.execute("UPDATE jobs SET completed = completed + ?, updated_at = ? WHERE id = ?", (updated, time.time(), job_id))
+
+    def _worker(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                with self._lock:
+                    rerun = job_id in self._rerun
+                    self._rerun.discard(job_id)
+                    if not rerun:
+                        self._active.discard(job_id)
+                if rerun:
+                    self._queue.put(job_id) # Still in _active, so it isn't queued twice
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT kind, status, params, options FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[1] not in ACTIVE_STATUSES:
+                return
+            items = [
+                (idx, json.loads(payload))
+                for idx, payload in conn.execute("SELECT idx, payload FROM job_items WHERE job_id = ? AND result IS NULL ORDER BY idx", (job_id,))
+            ]
+            conn.execute("UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?", (time.time(), job_id))
+        kind, _, params, options = row
+
+        def should_stop():
+            with self._lock:
+                return job_id in self._cancelled
+
+        def rerun_requested():
+            # The job was resumed while this run was stopping; its status is 'queued' again and must stay that way
+            with self._lock:
+                return job_id in self._rerun
+
+        try:
+            self.handlers[kind](
+                json.loads(params), json.loads(options), items,
+                lambda idx, result: self._checkpoint(job_id, idx, result),
+                should_stop,
+            )
+        except Exception as job_err:
+            print(f"Job {job_id} ({kind}) failed: {job_err}")
+            if not rerun_requested():
+                self._set_status(job_id, "failed", str(job_err))
+            return
+        if should_stop() or rerun_requested():
+            return # cancel() already recorded the status, or the job is queued to run again
+        job = self.status(job_id)
+        if job["completed"] >= job["total"]:
+            self._set_status(job_id, "done")
+        else:
+            self._set_status(job_id, "failed", f"Handler stopped after {job['completed']} of {job['total']} items")
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def media_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class SessionMediaStore:
+    """Holds a session's audio blobs once, outside st.session_state.messages, referenced by digest.
+
+    Blobs are kept in memory: st.audio copies whatever it plays into Streamlit's in-memory media
+    manager on every render anyway, so spilling them to disk wouldn't lower the server's RSS.
+    max_bytes is what actually bounds a session's audio; past it the oldest blobs are evicted,
+    so audio from old turns goes first.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # media_id -> {"data": bytes, "size": int, "mime_type": str}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, data, mime_type="application/octet-stream"):
+        media_id = media_digest(data)
+        with self._lock:
+            if media_id in self._entries:
+                self._entries.move_to_end(media_id)
+                return media_id
+            entry = {"data": data, "size": len(data), "mime_type": mime_type}
+            self._entries[media_id] = entry
+            self._size += entry["size"]
+            self._evict(keep=media_id)
+        return media_id
+
+    def _evict(self, keep):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            media_id = next(iter(self._entries))
+            if media_id == keep:
+                break
+            self._drop(media_id)
+
+    def _drop(self, media_id):
+        entry = self._entries.pop(media_id)
+        self._size -= entry["size"]
+
+    def __contains__(self, media_id):
+        return media_id in self._entries
+
+    def mime_type(self, media_id):
+        entry = self._entries.get(media_id)
+        return entry["mime_type"] if entry else None
+
+    def get(self, media_id):
+        # Returns the blob's bytes, or None if it was evicted
+        with self._lock:
+            entry = self._entries.get(media_id)
+        return entry["data"] if entry else None
+
+    def discard(self, media_id):
+        with self._lock:
+            if media_id in self._entries:
+                self._drop(media_id)
+
+    def clear(self):
+        with self._lock:
+            for media_id in list(self._entries):
+                self._drop(media_id)
+
+    @property
+    def size(self):
+        return self._size
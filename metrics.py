@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+def _percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return None
+    return sorted_samples[min(len(sorted_samples) - 1, int(fraction * len(sorted_samples)))]
+
+
+class StageStats:
+    def __init__(self, max_samples):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.last_error = None
+        self.samples = deque(maxlen=max_samples) # Recent durations, for percentiles
+
+
+class _Measurement:
+    def __init__(self):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.error = None # Set when the stage failed without raising (e.g. an error swallowed by the caller)
+
+
+class MetricsRegistry:
+    """Process-wide timers and counters for the hot paths (parsing, backend calls, TTS, caches).
+
+    Stages are timed with `with METRICS.timer("http.extract") as t:` and can carry payload sizes
+    (t.bytes_sent / t.bytes_received); an exception escaping the block counts as an error.
+    Plain events (retries, cache hits...) are counters.
+    """
+
+    def __init__(self, max_samples=2000):
+        self.max_samples = max_samples
+        self.started_at = time.time()
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds, error=None, bytes_sent=0, bytes_received=0):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats(self.max_samples)
+            stats.count += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.samples.append(seconds)
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            if error is not None:
+                stats.errors += 1
+                stats.last_error = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+
+    @contextmanager
+    def timer(self, stage):
+        measurement = _Measurement()
+        started = time.perf_counter()
+        try:
+            yield measurement
+        except GeneratorExit: # A consumer stopped reading a timed generator early; not a failure
+            self.record(stage, time.perf_counter() - started, bytes_sent=measurement.bytes_sent, bytes_received=measurement.bytes_received)
+            raise
+        except BaseException as err:
+            self.record(stage, time.perf_counter() - started, error=err, bytes_sent=measurement.bytes_sent, bytes_received=measurement.bytes_received)
+            raise
+        self.record(stage, time.perf_counter() - started, error=measurement.error, bytes_sent=measurement.bytes_sent, bytes_received=measurement.bytes_received)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Summary per stage plus counters, as plain data."""
+        with self._lock:
+            stages = {}
+            for stage, stats in self._stages.items():
+                samples = sorted(stats.samples)
+                stages[stage] = {
+                    "count": stats.count,
+                    "errors": stats.errors,
+                    "error_rate": stats.errors / stats.count if stats.count else 0.0,
+                    "mean_seconds": stats.total_seconds / stats.count if stats.count else 0.0,
+                    "p50_seconds": _percentile(samples, 0.50),
+                    "p95_seconds": _percentile(samples, 0.95),
+                    "p99_seconds": _percentile(samples, 0.99),
+                    "max_seconds": stats.max_seconds,
+                    "total_seconds": stats.total_seconds,
+                    "bytes_sent": stats.bytes_sent,
+                    "bytes_received": stats.bytes_received,
+                    "last_error": stats.last_error,
+                }
+            return {"timestamp": time.time(), "uptime_seconds": time.time() - self.started_at, "stages": stages, "counters": dict(self._counters)}
+
+    def to_prometheus(self, prefix="oncotrack"):
+        snapshot = self.snapshot()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent per pipeline stage.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for stage, stats in sorted(snapshot["stages"].items()):
+            for quantile in ("0.5", "0.95", "0.99"):
+                value = stats[f"p{int(float(quantile) * 100)}_seconds"]
+                if value is not None:
+                    lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {stats["total_seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        for metric, key, help_text in (
+            ("stage_errors_total", "errors", "Failed calls per pipeline stage."),
+            ("stage_bytes_sent_total", "bytes_sent", "Request payload bytes per stage."),
+            ("stage_bytes_received_total", "bytes_received", "Response payload bytes per stage."),
+        ):
+            lines.append(f"# HELP {prefix}_{metric} {help_text}")
+            lines.append(f"# TYPE {prefix}_{metric} counter")
+            for stage, stats in sorted(snapshot["stages"].items()):
+                lines.append(f'{prefix}_{metric}{{stage="{stage}"}} {stats[key]}')
+        lines.append(f"# HELP {prefix}_events_total Counted events (retries, cache hits and misses).")
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_line(self):
+        return json.dumps(self.snapshot())
+
+    def export(self, path, fmt="prometheus"):
+        # Prometheus text replaces the file (node_exporter textfile style); JSON lines append one snapshot per export
+        if fmt == "prometheus":
+            with open(path, "w") as f:
+                f.write(self.to_prometheus())
+        else:
+            with open(path, "a") as f:
+                f.write(self.to_json_line() + "\n")
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+
+METRICS = MetricsRegistry()
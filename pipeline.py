@@ -0,0 +1,146 @@
+import requests
+
+from backend_client import get_shared_client
+from extraction import chunked, run_concurrently
+
+
+def is_retryable_error(err):
+    # Retry dropped connections, timeouts, rate limiting and 5XX; a 4XX won't get better on retry
+    if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(err, requests.exceptions.HTTPError) and err.response is not None:
+        return err.response.status_code == 429 or err.response.status_code >= 500
+    return False
+
+
+def describe_http_error(e):
+    error_detail = f"API Error: {e.response.status_code}"
+    try:
+        error_json = e.response.json()
+        error_detail += f" - {error_json.get('error', e.response.text)}"
+    except ValueError:
+        error_detail += f" - {e.response.text}"
+    return error_detail
+
+
+def extraction_failed(result):
+    # Failed notes are checkpointed with the error string in place of the features
+    return not isinstance(result["response"], dict)
+
+
+def summary_failed(result):
+    return "summary" not in result
+
+
+def run_extraction_job(params, options, items, checkpoint, should_stop, extraction_cache=None):
+    """JobManager handler for "extract" jobs. Item payloads are {"order", "file_name", "note", "note_date"};
+    each result is the payload plus the note's "response"."""
+    client = get_shared_client(options["client"])
+    session_id = params["session_id"]
+    model_name = params["model_name"]
+
+    batch_size = options.get("batch_size", 1)
+    pending = []
+    to_index = [] # Cached elsewhere, but this session's vector store doesn't have them yet
+    for idx, item in items:
+        cached_response = None
+        if extraction_cache is not None and not options.get("bypass_cache"):
+            cached_response = extraction_cache.get(item["note"], model_name)
+        if cached_response is None:
+            pending.append((idx, item))
+        elif extraction_cache.indexed_for(item["note"], model_name, session_id):
+            checkpoint(idx, {**item, "response": cached_response}) # Already sent under this session: no backend call
+        elif client.supports_note_indexing():
+            to_index.append((idx, item, cached_response))
+        else:
+            # /extract is the only way this backend learns a note for chat, so the cached features can't save the call
+            pending.append((idx, item))
+
+    def index_notes(index_batch):
+        if should_stop():
+            raise InterruptedError("Job cancelled")
+        client.index_notes([item["note"] for _, item, _ in index_batch], session_id)
+
+    for index_batch, _, err in run_concurrently(
+        chunked(to_index, max(batch_size, 1)),
+        index_notes,
+        max_in_flight=options.get("max_in_flight", 4),
+        retries=options.get("max_retries", 2),
+        backoff=options.get("retry_backoff", 1.0),
+        should_retry=is_retryable_error,
+    ):
+        if should_stop():
+            return
+        for idx, item, cached_response in index_batch:
+            if err is None:
+                extraction_cache.mark_indexed(item["note"], model_name, session_id)
+                checkpoint(idx, {**item, "response": cached_response})
+            else:
+                pending.append((idx, item)) # Fall back to a full extraction, which indexes the note as well
+
+    use_batch = batch_size > 1 and "extract" in client.batch_endpoints()
+
+    def extract_notes(item_batch):
+        if should_stop():
+            raise InterruptedError("Job cancelled")
+        if use_batch:
+            return client.extract_batch([item["note"] for _, item in item_batch], session_id)
+        return [client.extract(item_batch[0][1]["note"], session_id)] # session_id is used for the vector store
+
+    for item_batch, batch_responses, err in run_concurrently(
+        chunked(pending, batch_size if use_batch else 1),
+        extract_notes,
+        max_in_flight=options.get("max_in_flight", 4),
+        retries=options.get("max_retries", 2),
+        backoff=options.get("retry_backoff", 1.0),
+        should_retry=is_retryable_error,
+    ):
+        if should_stop():
+            return # Unfinished items stay unchecked so the job can be resumed
+        for i, (idx, item) in enumerate(item_batch):
+            if err is None:
+                response_data = batch_responses[i]
+                if isinstance(response_data, dict) and extraction_cache is not None: # Only cache real features, never error strings
+                    extraction_cache.put(item["note"], model_name, response_data)
+                    extraction_cache.mark_indexed(item["note"], model_name, session_id)
+            elif isinstance(err, requests.exceptions.RequestException):
+                response_data = f"Error: API request failed - {err}"
+            else: # Catch other potential errors like JSON parsing
+                response_data = f"Error: Processing failed - {err}"
+            checkpoint(idx, {**item, "response": response_data})
+
+
+def run_summary_job(params, options, items, checkpoint, should_stop):
+    """JobManager handler for "summarise" jobs. Item payloads are feature dicts (one unique row each)."""
+    client = get_shared_client(options["client"])
+    session_id = params["session_id"]
+    batch_size = options.get("batch_size", 1)
+    use_batch = batch_size > 1 and "summarise_features" in client.batch_endpoints()
+
+    for item_batch in chunked(items, batch_size if use_batch else 1):
+        if should_stop():
+            return
+        payload_batch = [feature_payload for _, feature_payload in item_batch]
+        summary_items = [{"original_features": feature_payload} for feature_payload in payload_batch] # Store original for context
+
+        try:
+            if use_batch:
+                batch_results = client.summarise_batch(payload_batch, session_id)
+            else:
+                batch_results = [client.summarise(payload_batch[0], session_id)]
+            for summary_item, response_data in zip(summary_items, batch_results):
+                if "summary" in response_data:
+                    summary_item["summary"] = response_data["summary"]
+                elif "error" in response_data:
+                    summary_item["error"] = response_data["error"]
+                else:
+                    summary_item["error"] = "Unexpected response format from summary API."
+        except requests.exceptions.HTTPError as e:
+            for summary_item in summary_items: summary_item["error"] = describe_http_error(e)
+        except requests.exceptions.RequestException as e:
+            for summary_item in summary_items: summary_item["error"] = f"Connection/Request Error: {e}"
+        except Exception as e:
+            for summary_item in summary_items: summary_item["error"] = f"An unexpected error occurred: {e}"
+
+        for (idx, _), summary_item in zip(item_batch, summary_items):
+            checkpoint(idx, summary_item)
@@ -0,0 +1,197 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+from matplotlib.figure import Figure
+
+# "3.5", "3.5 cm", "40%": a number with an optional unit. Stages like "T2N0M0" don't count.
+NUMERIC_VALUE_PATTERN = r"^\s*([-+]?\d+(?:\.\d+)?)\s*[A-Za-z%/]*\s*$"
+DAYS_PER_MONTH = 30
+
+
+def numeric_features(df, min_parsed=0.8):
+    """Feature columns that hold numbers, as floats. Text columns qualify when at least
+    min_parsed of their values are a number with an optional unit."""
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            columns[column] = series.astype(float)
+            continue
+        present = series.dropna()
+        if present.empty:
+            continue
+        parsed = present.astype(str).str.extract(NUMERIC_VALUE_PATTERN, expand=False)
+        if parsed.notna().mean() >= min_parsed:
+            columns[column] = pd.to_numeric(parsed, errors="coerce").reindex(series.index)
+    return pd.DataFrame(columns, index=df.index)
+
+
+class ProgressionEngine:
+    """Per-patient time series of the extracted features, built once per FeaturesTable.
+
+    Rows are indexed by (patient, date, order), patient being the uploaded chart, and sorted,
+    so one patient's history is a slice of the index. Between-visit changes, per-patient trends
+    (least-squares slope per 30 days) and cohort aggregates by months since the first visit are
+    computed for every feature at once with grouped vector operations. Rendered plots are kept
+    as PNG bytes, so reruns that show the same chart don't draw it again.
+    """
+
+    def __init__(self, features_table, max_figures=32):
+        self.source = features_table
+        dated = features_table.note_dates.notna().to_numpy()
+        self.undated_notes = int((~dated).sum())
+        frame = features_table.features[dated]
+        index = pd.MultiIndex.from_arrays(
+            [features_table.file_names[dated].astype(str), features_table.note_dates[dated], frame.index],
+            names=["patient", "date", "order"],
+        )
+
+        numeric = numeric_features(frame)
+        self.values = numeric.set_axis(index).sort_index()
+        self.categories = frame.drop(columns=numeric.columns).astype(object).set_axis(index).sort_index()
+        self.numeric_features = list(self.values.columns)
+        self.category_features = list(self.categories.columns)
+        self.patients = list(self.values.index.unique(level="patient"))
+
+        visits = self.values.index.to_frame(index=False)
+        first_visit = visits.groupby("patient", sort=False)["date"].transform("min")
+        self.days_since_first = pd.Series((visits["date"] - first_visit).dt.days.to_numpy(), index=self.values.index, name="days_since_first")
+        self.days_since_previous = pd.Series(
+            visits.groupby("patient", sort=False)["date"].diff().dt.days.to_numpy(), index=self.values.index, name="days_since_previous"
+        )
+
+        by_patient = self.values.groupby(level="patient", sort=False)
+        # Change since the last visit that recorded the feature; visits without it stay empty
+        self.deltas = by_patient.ffill().groupby(level="patient", sort=False).diff().where(self.values.notna())
+        self.trends = self._trends()
+        self.patient_summary = pd.DataFrame({
+            "visits": by_patient.size(),
+            "first_visit": visits.groupby("patient", sort=False)["date"].min(),
+            "last_visit": visits.groupby("patient", sort=False)["date"].max(),
+        })
+        self.first_values = by_patient.first() # first()/last() skip missing values
+        self.last_values = by_patient.last()
+
+        self.previous_categories = self.categories.groupby(level="patient", sort=False).shift()
+        self.category_changed = self.categories.notna() & self.previous_categories.notna() & self.categories.ne(self.previous_categories)
+
+        month = (self.days_since_first // DAYS_PER_MONTH).rename("months_since_first")
+        by_month = self.values.groupby(month.to_numpy())
+        self.cohort_quantiles = by_month.quantile([0.25, 0.5, 0.75]) # index: (month, quantile)
+        self.cohort_counts = by_month.count()
+
+        self.max_figures = max_figures
+        self._figures = OrderedDict()
+        self._figures_lock = threading.Lock()
+
+    def _trends(self):
+        # Ordinary least squares slope of value over days, per patient and feature, from grouped sums
+        t = self.days_since_first.to_numpy(dtype=float)
+        valid = self.values.notna()
+        group = self.values.index.get_level_values("patient")
+        n = valid.groupby(group, sort=False).sum()
+        sum_t = valid.mul(t, axis=0).groupby(group, sort=False).sum()
+        sum_tt = valid.mul(t * t, axis=0).groupby(group, sort=False).sum()
+        sum_y = self.values.groupby(group, sort=False).sum()
+        sum_ty = self.values.mul(t, axis=0).groupby(group, sort=False).sum()
+        denominator = n * sum_tt - sum_t * sum_t
+        slopes = (n * sum_ty - sum_t * sum_y) / denominator.where(denominator > 0)
+        return slopes * DAYS_PER_MONTH
+
+    def feature_summary(self, feature):
+        """One row per patient: visits, follow-up, first/last value, change and trend per 30 days."""
+        summary = self.patient_summary.copy()
+        summary["follow_up_days"] = (summary["last_visit"] - summary["first_visit"]).dt.days
+        summary["first_value"] = self.first_values[feature]
+        summary["last_value"] = self.last_values[feature]
+        summary["change"] = summary["last_value"] - summary["first_value"]
+        summary["trend_per_30_days"] = self.trends[feature]
+        return summary.sort_values("trend_per_30_days", ascending=False, na_position="last")
+
+    def patient_visits(self, patient):
+        # The patient's rows are one contiguous slice of the sorted index
+        values = self.values.xs(patient, level="patient")
+        deltas = self.deltas.xs(patient, level="patient").add_suffix(" (change)")
+        visits = pd.concat([self.days_since_previous.xs(patient, level="patient"), values, deltas], axis=1)
+        return visits[["days_since_previous"] + [column for feature in self.numeric_features for column in (feature, f"{feature} (change)")]]
+
+    def category_transitions(self, patient):
+        """Visits where a text feature (stage, site, treatment...) differs from the previous visit."""
+        changed = self.category_changed.xs(patient, level="patient")
+        categories = self.categories.xs(patient, level="patient")
+        previous = self.previous_categories.xs(patient, level="patient")
+        rows = []
+        for feature in self.category_features:
+            mask = changed[feature].to_numpy()
+            if mask.any():
+                rows.append(pd.DataFrame({
+                    "feature": feature,
+                    "from": previous.loc[mask, feature].to_numpy(),
+                    "to": categories.loc[mask, feature].to_numpy(),
+                }, index=categories.index[mask]))
+        if not rows:
+            return pd.DataFrame(columns=["feature", "from", "to"])
+        return pd.concat(rows).sort_index()
+
+    def _figure_png(self, key, draw):
+        with self._figures_lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                return self._figures[key]
+        # Figure rather than pyplot, which is global state shared by every session's script thread
+        fig = Figure(figsize=(8, 4), layout="constrained")
+        draw(fig.add_subplot())
+        buffer = BytesIO()
+        fig.savefig(buffer, format="png", dpi=100)
+        png = buffer.getvalue()
+        with self._figures_lock:
+            self._figures[key] = png
+            while len(self._figures) > self.max_figures:
+                self._figures.popitem(last=False)
+        return png
+
+    def patient_plot(self, patient, features):
+        def draw(ax):
+            history = self.values.xs(patient, level="patient").droplevel("order")
+            for feature in features:
+                series = history[feature].dropna()
+                ax.plot(series.index, series.to_numpy(), marker="o", label=feature)
+            ax.set_title(patient)
+            ax.set_xlabel("Visit date")
+            ax.legend(loc="best")
+            ax.grid(alpha=0.3)
+        return self._figure_png(("patient", patient, tuple(features)), draw)
+
+    def cohort_plot(self, feature):
+        def draw(ax):
+            quantiles = self.cohort_quantiles[feature].unstack()
+            months = quantiles.index.to_numpy()
+            ax.fill_between(months, quantiles[0.25].to_numpy(), quantiles[0.75].to_numpy(), alpha=0.25, label="Interquartile range")
+            ax.plot(months, quantiles[0.5].to_numpy(), marker="o", label="Median")
+            ax.set_title(f"{feature} across patients")
+            ax.set_xlabel("Months since first visit")
+            ax.legend(loc="best")
+            ax.grid(alpha=0.3)
+        return self._figure_png(("cohort", feature), draw)
+
+    def trend_plot(self, feature):
+        def draw(ax):
+            trends = self.trends[feature].dropna().to_numpy()
+            ax.hist(trends, bins=min(30, max(5, len(trends) // 5)))
+            ax.axvline(0, color="black", linewidth=1)
+            ax.set_title(f"{feature}: trend per patient")
+            ax.set_xlabel("Change per 30 days")
+            ax.set_ylabel("Patients")
+        return self._figure_png(("trend", feature), draw)
+
+    @staticmethod
+    def empty_reason(features_table):
+        if not len(features_table):
+            return "No features were extracted."
+        if features_table.note_dates.isna().all():
+            return "None of the extracted notes has a readable date."
+        return None
@@ -0,0 +1,89 @@
+import re
+from collections import namedtuple
+from datetime import date
+
+# A progress note starts at its "Date : dd/mm/yyyy ProgressNotes :" header and runs until the next
+# header, a "Signed By" line or the end of the document.
+HEADER_PATTERN = re.compile(r"Date\s*:\s*(?P<day>\d{2})\/(?P<month>\d{2})\/(?P<year>\d{4})\s*ProgressNotes\s*:")
+SIGNED_MARKER = "Signed By"
+
+# Longest marker the streaming segmenter expects to straddle a chunk boundary
+MAX_MARKER_CHARS = 1024
+
+ProgressNote = namedtuple("ProgressNote", ["date", "date_text", "offset", "text"])
+
+
+def _note_date(match):
+    date_text = f"{match.group('day')}/{match.group('month')}/{match.group('year')}"
+    try:
+        return date(int(match.group("year")), int(match.group("month")), int(match.group("day"))), date_text
+    except ValueError: # e.g. 31/02/2024 typed into a chart
+        return None, date_text
+
+
+def iter_progress_notes(chunks):
+    """Yields ProgressNote records, in document order, from an iterable of text chunks.
+
+    Headers and "Signed By" markers are found in a single forward pass and notes are sliced
+    between them, so the cost is linear in the document size. Only the note currently being
+    read is held in memory, which lets very large documents be processed as a stream.
+    `offset` is the character position of the note's header in the whole document.
+    """
+    buffer = ""
+    base = 0 # Document offset of buffer[0]
+    scan_pos = 0 # Everything before this in buffer has been scanned for markers
+    open_note = None # (date, date_text, start in buffer) of the note being read
+    chunk_iter = iter(chunks)
+    final = False
+
+    while not final:
+        chunk = next(chunk_iter, None)
+        if chunk is None:
+            final = True
+        else:
+            buffer += chunk
+        # A marker that starts too close to the end of the buffer may continue in the next chunk
+        limit = len(buffer) if final else len(buffer) - MAX_MARKER_CHARS
+
+        # Headers and "Signed By" can't overlap, so each is found with its own fast literal-prefix
+        # scan and the two position lists are merged; a single alternation regex is several times slower.
+        markers = []
+        for match in HEADER_PATTERN.finditer(buffer, scan_pos):
+            if match.start() >= limit:
+                break
+            markers.append((match.start(), match.end(), match))
+        signed_pos = buffer.find(SIGNED_MARKER, scan_pos, max(scan_pos, limit + len(SIGNED_MARKER) - 1))
+        while signed_pos != -1:
+            markers.append((signed_pos, signed_pos + len(SIGNED_MARKER), None))
+            signed_pos = buffer.find(SIGNED_MARKER, signed_pos + len(SIGNED_MARKER), limit + len(SIGNED_MARKER) - 1)
+        markers.sort(key=lambda marker: marker[0])
+
+        for marker_start, marker_end, header in markers:
+            if open_note is not None:
+                note_date, date_text, start = open_note
+                yield ProgressNote(note_date, date_text, base + start, buffer[start:marker_start])
+                open_note = None
+            if header is not None:
+                open_note = (*_note_date(header), marker_start)
+            scan_pos = marker_end
+        scan_pos = max(scan_pos, limit)
+
+        # Drop text that can't be part of a note any more
+        cut = open_note[2] if open_note is not None else scan_pos
+        if cut > 0 and not final:
+            buffer = buffer[cut:]
+            base += cut
+            scan_pos -= cut
+            if open_note is not None:
+                open_note = (open_note[0], open_note[1], 0)
+
+    if open_note is not None:
+        note_date, date_text, start = open_note
+        end = len(buffer)
+        if buffer.endswith("\n"):
+            end -= 1 # Matches the original regex, whose `$` stops before a trailing newline
+        yield ProgressNote(note_date, date_text, base + start, buffer[start:end])
+
+
+def segment_progress_notes(text):
+    return list(iter_progress_notes([text]))
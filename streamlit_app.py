@@ -1,21 +1,209 @@
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
-import re
-import mammoth
 import requests  # For making HTTP requests
 import base64
 import uuid
+import functools
+import os
+import time
 from st_audiorec import st_audiorec # Corrected import based on user preference
-from gtts import gTTS
-from io import BytesIO
-import markdown
-from bs4 import BeautifulSoup
+from audio_encoding import downsample_wav, encode_for_upload
+from backend_client import get_shared_client
+from extraction_cache import DEFAULT_CACHE_DIR, ExtractionCache
+from features_table import EXPORT_FORMATS, FeaturesTable, parquet_available
+from ingestion import DocumentParser
+from job_manager import ACTIVE_STATUSES, JobManager
+from media_store import SessionMediaStore, media_digest
+from metrics import METRICS
+from pipeline import extraction_failed, run_extraction_job, run_summary_job, summary_failed
+from progression import ProgressionEngine
+from summary_index import SummaryIndex, unique_feature_rows
+from tts import TTS_BACKENDS, TTSWorker, audio_duration
+
+
+@st.cache_resource
+def get_extraction_cache():
+    # One cache per server process, shared by every session
+    return ExtractionCache()
+
+
+def backend_client_settings(server_url, pool_size, gzip_requests, extract_timeout, summary_timeout, chat_timeout):
+    # Plain JSON so background jobs can rebuild (or share) the same client
+    return {
+        "base_url": server_url,
+        "pool_size": int(pool_size),
+        "gzip_requests": bool(gzip_requests),
+        "timeouts": {
+            "extract": [10, extract_timeout],
+            "summarise_features": [10, summary_timeout],
+            "chat_interaction": [10, chat_timeout],
+        },
+    }
+
+
+@st.cache_resource
+def get_backend_client(settings):
+    # One pooled keep-alive client per server URL and settings, shared by every session, rerun and background job
+    return get_shared_client(settings)
+
+
+@st.cache_resource
+def get_tts_worker():
+    # Background synthesis threads and the audio LRU are shared by every session
+    return TTSWorker()
+
+
+@st.cache_resource
+def get_tts_backend(engine_name):
+    return TTS_BACKENDS[engine_name]()
+
+
+@st.fragment(run_every=1)
+def render_pending_tts(msg):
+    # Polls the TTS worker until the reply's audio is ready, playing sentence chunks as they arrive.
+    # A player's arguments never change while its chunk plays: st.audio remounts (and stops) when they do.
+    job = tts_worker.job(msg["tts_job_id"])
+    if job is None: # Worker restarted or the job expired; nothing to attach
+        msg.pop("tts_job_id")
+        return
+    autoplay = msg.get("autoplay_tts", False)
+    playing = msg.get("tts_playing_chunk", 0)
+    chunk_finished = bool(job.audio_chunks) and time.time() - msg.get("tts_chunk_started_at", time.time()) >= audio_duration(job.audio_chunks[playing], job.mime_type)
+    if autoplay and chunk_finished and playing + 1 < len(job.audio_chunks):
+        # Spoken replies play chunk by chunk: the next player autoplays once the previous chunk has had time to finish
+        playing += 1
+        msg["tts_playing_chunk"] = playing
+        msg["tts_chunk_started_at"] = time.time()
+        chunk_finished = False
+
+    if job.done and (not autoplay or not job.audio_chunks or (chunk_finished and playing + 1 >= len(job.audio_chunks))):
+        tts_worker.pop(msg.pop("tts_job_id"))
+        msg.pop("tts_playing_chunk", None)
+        msg.pop("tts_chunk_started_at", None)
+        msg["autoplay_tts"] = False # The whole reply has been heard; attach it for replay only
+        tts_audio = job.audio()
+        if tts_audio:
+            msg["tts_audio_id"] = st.session_state.media_store.put(tts_audio, job.mime_type)
+        st.rerun()
+    if job.audio_chunks:
+        st.audio(job.audio_chunks[playing], format=job.mime_type, autoplay=autoplay)
+        msg.setdefault("tts_chunk_started_at", time.time())
+    if job.done:
+        st.caption(f"🔊 Playing reply... ({playing + 1}/{len(job.audio_chunks)})")
+    else:
+        st.caption(f"🔊 Preparing audio... ({len(job.audio_chunks)}/{len(job.text_chunks)})")
+
+
+@st.cache_resource
+def get_document_parser():
+    # Process pool and parsed-document memo shared by every session
+    return DocumentParser()
+
+
+@st.cache_resource
+def get_job_manager():
+    # Worker threads and the job table outlive reruns, page switches and websocket reconnects
+    return JobManager(
+        handlers={
+            "extract": functools.partial(run_extraction_job, extraction_cache=get_extraction_cache()),
+            "summarise": run_summary_job,
+        },
+        failed_result={"extract": extraction_failed, "summarise": summary_failed},
+    )
+
+
+@st.fragment(run_every=1)
+def render_job_progress(job_id, item_label):
+    # Polls a background job; a full rerun picks up the results once it stops running
+    job = get_job_manager().status(job_id)
+    if job is None or job["status"] not in ACTIVE_STATUSES:
+        st.rerun()
+    st.progress(job["completed"] / job["total"] if job["total"] else 1.0)
+    st.text(f"Remaining {item_label}: {job['total'] - job['completed']}")
+    if st.button("Cancel", key=f"cancel_job_{job_id}"):
+        get_job_manager().cancel(job_id)
+        st.rerun()
+
+
+def sync_finished_jobs():
+    # Copies results of jobs that finished (possibly while the user was on another page) into session state
+    extract_job_id = st.session_state.get("extract_job_id")
+    if extract_job_id and st.session_state.get("extract_job_synced") != extract_job_id:
+        job = job_manager.status(extract_job_id)
+        if job is not None and job["status"] == "done":
+            all_responses = [resp for resp in job_manager.results(extract_job_id) if resp is not None]
+            if isinstance(st.session_state.get("extracted_text"), dict):
+                for file_data in st.session_state["extracted_text"].values():
+                    file_data["responses"] = []
+                for resp in all_responses:
+                    if resp["file_name"] in st.session_state["extracted_text"]:
+                        st.session_state["extracted_text"][resp["file_name"]]["responses"].append(resp)
+            st.session_state["all_responses"] = all_responses
+            # The typed table is built here, once per finished job, not on every rerun of the Upload page
+            features_table = FeaturesTable(all_responses)
+            st.session_state.features_table = features_table
+            st.session_state["edited_responses"] = features_table.features if len(features_table) else None
+            st.session_state.extract_job_synced = extract_job_id
+
+    summary_job_id = st.session_state.get("summary_job_id")
+    if summary_job_id and st.session_state.summary_loading:
+        job = job_manager.status(summary_job_id)
+        if job is None:
+            st.session_state.summary_loading = False
+        elif job["status"] == "done":
+            # Index the new summaries by row hash, then lay out every row's summary in display order
+            failed_items = {}
+            for row_hash, item in zip(st.session_state.summary_pending_hashes, job_manager.results(summary_job_id)):
+                if item is None:
+                    continue
+                st.session_state.summary_index.add(row_hash, item)
+                if "summary" not in item:
+                    failed_items[row_hash] = item
+            st.session_state.generated_summaries_list = [
+                st.session_state.summary_index.get(row_hash) or failed_items[row_hash]
+                for row_hash in st.session_state.summary_row_hashes
+                if row_hash in st.session_state.summary_index or row_hash in failed_items
+            ]
+            st.session_state.summary_loading = False
+        elif job["status"] not in ACTIVE_STATUSES:
+            st.session_state.summary_error_text = f"Summary generation {job['status']}: {job['error'] or 'stopped before finishing'}"
+            st.session_state.summary_loading = False
+
 
 with st.sidebar:
     kaggle_server_url = st.text_input("Kaggle Server URL", "https://dominant-usually-oyster.ngrok-free.app", key="kaggle-server-url", type="default")
+    batch_size = st.number_input("Batch size (notes / feature sets per request)", min_value=1, max_value=64, value=8, step=1, key="batch-size")
     model_name = st.text_input("Model Name", "NishithP2004/tsa_oral_cancer_data_extraction_Meta-Llama-3.1-8B-bnb-4bit_10e", key="model-name")
-    page = st.selectbox("Navigation", ["📤 Upload & Extract", "📝 Summary", "💬 Chat with AI"])
+    max_in_flight = st.number_input("Max concurrent requests", min_value=1, max_value=32, value=4, step=1, key="max-in-flight")
+    max_retries = st.number_input("Max retries per request", min_value=0, max_value=10, value=2, step=1, key="max-retries")
+    retry_backoff = st.number_input("Retry backoff (seconds)", min_value=0.0, max_value=30.0, value=1.0, step=0.5, key="retry-backoff")
+    with st.expander("Connection settings"):
+        pool_size = st.number_input("Connection pool size", min_value=1, max_value=64, value=10, step=1, key="pool-size")
+        gzip_requests = st.checkbox("Gzip request bodies", value=False, key="gzip-requests")
+        extract_timeout = st.number_input("Extract timeout (seconds)", min_value=5, max_value=600, value=60, step=5, key="extract-timeout")
+        summary_timeout = st.number_input("Summary timeout (seconds)", min_value=5, max_value=600, value=120, step=5, key="summary-timeout")
+        chat_timeout = st.number_input("Chat timeout (seconds)", min_value=5, max_value=600, value=60, step=5, key="chat-timeout")
+    client_settings = backend_client_settings(kaggle_server_url, pool_size, gzip_requests, extract_timeout, summary_timeout, chat_timeout)
+    backend_client = get_backend_client(client_settings) if kaggle_server_url else None
+    tts_engine = st.selectbox("Text-to-speech", list(TTS_BACKENDS) + ["Off"], key="tts-engine")
+    tts_worker = get_tts_worker()
+    tts_backend = None
+    if tts_engine != "Off":
+        try:
+            tts_backend = get_tts_backend(tts_engine)
+        except Exception as tts_err:
+            st.warning(f"{tts_engine} is unavailable: {tts_err}")
+    voice_upload_mode = st.selectbox("Voice upload", ["Binary (compressed)", "JSON (base64)"], key="voice-upload-mode")
+    stream_chat_responses = st.checkbox("Stream chat responses", value=True, key="stream-chat-responses")
+    bypass_extraction_cache = st.checkbox("Bypass extraction cache", value=False, key="bypass-extraction-cache")
+    extraction_cache = get_extraction_cache()
+    if st.button("Clear extraction cache"):
+        extraction_cache.clear()
+        st.success("Extraction cache cleared.")
+    cache_stats = extraction_cache.stats()
+    st.caption(f"Extraction cache: {cache_stats['entries']} entries · {cache_stats['hits']} hits · {cache_stats['misses']} misses")
+    page = st.selectbox("Navigation", ["📤 Upload & Extract", "📈 Progression", "📝 Summary", "💬 Chat with AI"])
     
     if "reset_counter" not in st.session_state:
         st.session_state["reset_counter"] = 0
@@ -26,17 +214,21 @@ with st.sidebar:
         st.session_state.summary_loading = False
         st.session_state.generated_summaries_list = []
         st.session_state.messages = [{"role": "assistant", "content": "How can I help you?"}]
-        st.session_state.last_submitted_audio_bytes = None # Initialize for audio loop fix
+        st.session_state.last_submitted_audio_digest = None # Initialize for audio loop fix
     
     if "summary_text" not in st.session_state: st.session_state.summary_text = None
     if "summary_error_text" not in st.session_state: st.session_state.summary_error_text = None
     if "summary_loading" not in st.session_state: st.session_state.summary_loading = False
     if "generated_summaries_list" not in st.session_state: st.session_state.generated_summaries_list = []
+    if "summary_index" not in st.session_state: st.session_state.summary_index = SummaryIndex() # Row hash -> summary, reused across Generate presses
     if "messages" not in st.session_state: st.session_state.messages = [{"role": "assistant", "content": "How can I help you?"}]
-    if "last_submitted_audio_bytes" not in st.session_state: st.session_state.last_submitted_audio_bytes = None # Ensure initialized
+    if "last_submitted_audio_digest" not in st.session_state: st.session_state.last_submitted_audio_digest = None # Ensure initialized
+    if "media_store" not in st.session_state: st.session_state.media_store = SessionMediaStore() # Audio blobs, referenced by ID from messages
 
 
     if st.button("Reset Session"):
+        for msg in st.session_state.get("messages", []):
+            if msg.get("tts_job_id"): get_tts_worker().pop(msg["tts_job_id"]) # Replies still being spoken won't be collected now
         st.session_state["extracted_text"] = ""
         st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
         st.session_state["edited_responses"] = None
@@ -47,19 +239,29 @@ with st.sidebar:
         st.session_state.summary_error_text = None
         st.session_state.summary_loading = False
         st.session_state.generated_summaries_list = []
-        st.session_state.last_submitted_audio_bytes = None # Reset for audio loop fix
-        if "pending_audio_payload" in st.session_state: st.session_state.pop("pending_audio_payload")
-        if "pending_audio_payload_source_bytes" in st.session_state: st.session_state.pop("pending_audio_payload_source_bytes")
+        st.session_state.summary_index.clear()
+        st.session_state.last_submitted_audio_digest = None # Reset for audio loop fix
+        st.session_state.media_store.clear()
+        if "pending_audio_id" in st.session_state: st.session_state.pop("pending_audio_id")
+        if "pending_audio_source_digest" in st.session_state: st.session_state.pop("pending_audio_source_digest")
         if "pending_text_payload" in st.session_state: st.session_state.pop("pending_text_payload")
+        for job_key in ("extract_job_id", "summary_job_id"):
+            if job_key in st.session_state: get_job_manager().cancel(st.session_state.pop(job_key))
+        if "extract_job_synced" in st.session_state: st.session_state.pop("extract_job_synced")
+        if "features_table" in st.session_state: st.session_state.pop("features_table")
+        if "progression" in st.session_state: st.session_state.pop("progression")
         st.success("Session has been reset.")
         st.rerun()
 
-st.title("🦠 OncoTrack: Time Series Analysis of Oral Cancer Progression") # Title might need update if TS is gone
+st.title("🦠 OncoTrack: Time Series Analysis of Oral Cancer Progression")
 st.caption("🔍 Analyze patient records and track disease progression over time")
 
 if "extracted_text" not in st.session_state:
     st.session_state["extracted_text"] = ""
 
+job_manager = get_job_manager()
+sync_finished_jobs()
+
 if page == "📤 Upload & Extract":
     st.header("Upload Patient Records")
     uploaded_files = st.file_uploader(
@@ -70,101 +272,173 @@ if page == "📤 Upload & Extract":
     )
     
     if uploaded_files:
+        document_parser = get_document_parser()
         extracted_texts = {}
-        all_progress_notes = []
+        # Parsed in worker processes and memoized by content hash, so reruns and added files only parse what's new
+        parsed_documents = document_parser.parse_many([(file.name, file.getvalue()) for file in uploaded_files])
         for file in uploaded_files:
-            try:
-                result = mammoth.extract_raw_text(file)
-                text = result.value
-                cleaned_text = re.sub(r'(\n){3,}', "\n", text)
-                cleaned_text = re.sub(r'(\t)+', " ", cleaned_text)
-                cleaned_text = re.sub(r'(\r\n)+', "\n", cleaned_text)
-                progress_notes = re.findall(
-                    r"Date\s*:\s*\d{2}\/\d{2}\/\d{4}\s*ProgressNotes\s*:(?:.*?(?=Date\s*:\s*\d{2}\/\d{2}\/\d{4}\s*ProgressNotes\s*:|Signed By|$))", 
-                    cleaned_text,
-                    flags=re.DOTALL
-                )
-                st.success(f"Text extracted from {file.name} successfully!")
-                st.info(f"Found {len(progress_notes)} progress note(s) in {file.name}")
-                st.text_area(f"Extracted Text Preview - {file.name}", cleaned_text, height=300)
-                extracted_texts[file.name] = {
-                    "cleaned_text": cleaned_text,
-                    "progress_notes": progress_notes,
-                    "responses": []
-                }
-                for note in progress_notes:
-                    all_progress_notes.append((file.name, note))
-            except Exception as err:
-                st.error(f"Error processing {file.name}: {err}")
+            parsed = parsed_documents[file.name]
+            if isinstance(parsed, Exception):
+                st.error(f"Error processing {file.name}: {parsed}")
+                continue
+            progress_notes = parsed["progress_notes"]
+            st.success(f"Text extracted from {file.name} successfully!")
+            st.info(f"Found {len(progress_notes)} progress note(s) in {file.name}")
+            extracted_texts[file.name] = {
+                "cleaned_text": parsed["cleaned_text"],
+                "progress_notes": progress_notes,
+                "note_dates": [note.date.isoformat() if note.date else None for note in parsed["note_records"]], # Kept for the progression view
+                "responses": []
+            }
 
-        total_notes = len(all_progress_notes)
-        progress_bar = st.progress(0)
-        progress_text = st.empty()
-        note_counter = 0
+        # Only the selected document's text is sent to the browser
+        preview_name = st.selectbox("Extracted Text Preview", ["(none)"] + list(extracted_texts), key=f"preview_file_{st.session_state['reset_counter']}")
+        if preview_name != "(none)":
+            st.text_area(f"Extracted Text Preview - {preview_name}", extracted_texts[preview_name]["cleaned_text"], height=300)
 
+        # Number the notes up front so `order` matches the upload order regardless of completion order
+        note_payloads = []
         for file_obj in uploaded_files: # Renamed 'file' to 'file_obj' to avoid conflict
-            responses = []
             if file_obj.name in extracted_texts: # Check if file was successfully processed earlier
-                for note in extracted_texts[file_obj.name]["progress_notes"]:
-                    note_counter += 1
-                    payload = {
-                        "text": note,
-                        "session_id": st.session_state.session_id # Add session_id for vector store
-                    }
-                    # Use a try-except block for the API call
-                    try:
-                        if not kaggle_server_url:
-                            st.error("Kaggle Server URL not set. Cannot extract features.")
-                            responses.append({"order": note_counter, "note": note, "response": "Error: Kaggle Server URL not set."})
-                            continue
-
-                        api_url = f"{kaggle_server_url.rstrip('/')}/extract"
-                        r = requests.post(api_url, json=payload, timeout=60) # Added timeout
-                        r.raise_for_status() # Raise HTTPError for bad responses (4XX or 5XX)
-                        response_data = r.json().get("response", f"Error: 'response' key missing in API result from {api_url}")
-                        responses.append({"order": note_counter, "note": note, "response": response_data})
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"API Error for note {note_counter}: {e}")
-                        responses.append({"order": note_counter, "note": note, "response": f"Error: API request failed - {e}"})
-                    except Exception as e: # Catch other potential errors like JSON parsing
-                        st.error(f"Processing Error for note {note_counter}: {e}")
-                        responses.append({"order": note_counter, "note": note, "response": f"Error: Processing failed - {e}"})
-                    
-                    progress = note_counter / total_notes if total_notes > 0 else 1
-                    progress_bar.progress(progress)
-                    remaining = total_notes - note_counter
-                    progress_text.text(f"Remaining progress notes: {remaining}")
-                extracted_texts[file_obj.name]["responses"] = responses
-        
-        st.session_state["extracted_text"] = extracted_texts
-        st.session_state["all_responses"] = [resp for file_data in extracted_texts.values() for resp in file_data["responses"]]
+                file_data = extracted_texts[file_obj.name]
+                for note, note_date in zip(file_data["progress_notes"], file_data["note_dates"]):
+                    note_payloads.append({"order": len(note_payloads) + 1, "file_name": file_obj.name, "note": note, "note_date": note_date})
+
+        if note_payloads and not kaggle_server_url:
+            st.error("Kaggle Server URL not set. Cannot extract features.")
+        elif note_payloads:
+            # Extraction runs as a background job checkpointed per note. Reruns, page switches and
+            # reconnects submit the same work again and so re-attach to the job instead of restarting it.
+            extract_job_args = dict(
+                kind="extract",
+                owner=st.session_state.session_id,
+                params={"session_id": st.session_state.session_id, "model_name": model_name, "server_url": kaggle_server_url},
+                payloads=note_payloads,
+                options={
+                    "client": client_settings,
+                    "batch_size": int(batch_size),
+                    "max_in_flight": int(max_in_flight),
+                    "max_retries": int(max_retries),
+                    "retry_backoff": float(retry_backoff),
+                    "bypass_cache": bypass_extraction_cache,
+                },
+            )
+            extract_job_id = job_manager.submit(**extract_job_args)
+            if st.session_state.get("extract_job_id") != extract_job_id:
+                st.session_state["extract_job_id"] = extract_job_id
+                st.session_state["extracted_text"] = extracted_texts
+            extract_job = job_manager.status(extract_job_id)
+            if extract_job["status"] in ACTIVE_STATUSES:
+                render_job_progress(extract_job_id, "progress notes")
+            elif extract_job["status"] in ("failed", "cancelled"):
+                st.error(f"Feature extraction {extract_job['status']} after {extract_job['completed']} of {extract_job['total']} notes. {extract_job['error'] or ''}")
+                if st.button("Resume extraction", key=f"resume_job_{extract_job_id}"):
+                    job_manager.resume(extract_job_id)
+                    st.rerun()
+            elif st.session_state.get("extract_job_synced") != extract_job_id:
+                sync_finished_jobs()
+
+            # Notes that still failed after the automatic retries are only sent again on request
+            synced_table = st.session_state.get("features_table")
+            if extract_job["status"] == "done" and synced_table is not None and not synced_table.errors.empty:
+                if st.button(f"Retry {len(synced_table.errors)} failed note(s)", key=f"retry_failed_notes_{extract_job_id}"):
+                    job_manager.submit(**extract_job_args, retry=True)
+                    if "extract_job_synced" in st.session_state: st.session_state.pop("extract_job_synced")
+                    st.rerun()
 
-    if st.session_state.get("all_responses"):
+    features_table = st.session_state.get("features_table")
+    if features_table is not None and st.session_state.get("all_responses"):
         st.markdown("## Extracted Features")
-        ordered_responses = sorted(st.session_state["all_responses"], key=lambda x: x["order"])
-        
-        # Filter out responses that are error strings before creating DataFrame
-        valid_response_dicts = []
-        for entry in ordered_responses:
-            if isinstance(entry["response"], dict):
-                 valid_response_dicts.append(entry["response"])
-            else:
-                # Optionally log or display that some notes had feature extraction errors
-                st.warning(f"Note (Order: {entry['order']}) had a feature extraction error: {entry['response']}")
-
-        if valid_response_dicts:
-            df_responses = pd.DataFrame(valid_response_dicts)
-            st.session_state["edited_responses"] = st.data_editor(
-                df_responses,
-                num_rows="dynamic",
-                use_container_width=True,
-                disabled=True, 
-                key=f"data_editor_unique_{st.session_state['reset_counter']}" # Dynamic key
-            )
+        reset_counter = st.session_state['reset_counter']
+
+        # One summary of the failed notes, grouped by error, instead of a warning per note
+        if not features_table.errors.empty:
+            st.warning(f"{len(features_table.errors)} note(s) had a feature extraction error.")
+            with st.expander("Extraction errors"):
+                st.dataframe(features_table.error_summary(), use_container_width=True, hide_index=True)
+
+        if len(features_table):
+            # Filtering and paging happen here; only the visible page is sent to the browser
+            filter_cols = st.columns([2, 2, 1])
+            file_filter = filter_cols[0].multiselect("Files", features_table.file_options(), key=f"features_files_{reset_counter}")
+            text_filter = filter_cols[1].text_input("Search features", key=f"features_search_{reset_counter}")
+            page_size = filter_cols[2].selectbox("Rows per page", [25, 50, 100, 250], key=f"features_page_size_{reset_counter}")
+            shown_columns = st.multiselect("Columns", list(features_table.features.columns), key=f"features_columns_{reset_counter}", placeholder="All columns")
+
+            filtered_index = features_table.filtered_index(file_filter, text_filter)
+            page_count = max(1, -(-len(filtered_index) // page_size))
+            page_number = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1, key=f"features_page_{reset_counter}")
+            page_start = (min(page_number, page_count) - 1) * page_size
+            page_index = filtered_index[page_start:page_start + page_size]
+            st.dataframe(features_table.rows(page_index, shown_columns), use_container_width=True)
+            st.caption(f"Rows {page_start + 1 if len(page_index) else 0}–{page_start + len(page_index)} of {len(filtered_index)} (of {len(features_table)} extracted)")
+
+            # Serialized from the cached frame once per format, then reused by every rerun
+            export_formats = [fmt for fmt in EXPORT_FORMATS if fmt != "Parquet" or parquet_available()]
+            export_format = st.selectbox("Export features", ["(none)"] + export_formats, key=f"features_export_{reset_counter}")
+            if export_format != "(none)":
+                export_mime, export_extension = EXPORT_FORMATS[export_format]
+                st.download_button(
+                    f"Download {export_format}",
+                    data=features_table.export(export_format),
+                    file_name=f"extracted_features.{export_extension}",
+                    mime=export_mime,
+                    key=f"features_download_{reset_counter}",
+                )
         else:
             st.info("No valid features extracted to display.")
 
 
+elif page == "📈 Progression":
+    st.header("Disease Progression")
+
+    features_table = st.session_state.get("features_table")
+    empty_reason = "Please upload and extract features from documents first." if features_table is None else ProgressionEngine.empty_reason(features_table)
+    if empty_reason:
+        st.warning(empty_reason)
+    else:
+        # Built once per extraction job; reruns only pick slices and cached charts out of it
+        progression = st.session_state.get("progression")
+        if progression is None or progression.source is not features_table:
+            progression = ProgressionEngine(features_table)
+            st.session_state.progression = progression
+        st.info(f"{len(progression.patients)} patient(s), {len(progression.values)} dated note(s).")
+        if progression.undated_notes:
+            st.caption(f"{progression.undated_notes} note(s) without a readable date are left out.")
+
+        cohort_tab, patient_tab = st.tabs(["Cohort", "Patient"])
+        with cohort_tab:
+            if not progression.numeric_features:
+                st.info("No numeric features were extracted, so there is nothing to plot across patients.")
+            else:
+                cohort_feature = st.selectbox("Feature", progression.numeric_features, key=f"cohort_feature_{st.session_state['reset_counter']}")
+                st.image(progression.cohort_plot(cohort_feature))
+                st.image(progression.trend_plot(cohort_feature))
+                st.markdown("#### Per-patient trend")
+                st.dataframe(progression.feature_summary(cohort_feature), use_container_width=True)
+
+        with patient_tab:
+            patient = st.selectbox("Patient", progression.patients, key=f"progression_patient_{st.session_state['reset_counter']}")
+            if progression.numeric_features:
+                plotted_features = st.multiselect(
+                    "Features to plot",
+                    progression.numeric_features,
+                    default=progression.numeric_features[:1],
+                    key=f"progression_features_{st.session_state['reset_counter']}"
+                )
+                if plotted_features:
+                    st.image(progression.patient_plot(patient, plotted_features))
+                st.markdown("#### Visits and changes since the previous visit")
+                st.dataframe(progression.patient_visits(patient), use_container_width=True)
+            if progression.category_features:
+                st.markdown("#### Changes in recorded findings")
+                transitions = progression.category_transitions(patient)
+                if transitions.empty:
+                    st.caption("No text feature changed between visits.")
+                else:
+                    st.dataframe(transitions, use_container_width=True)
+
+
 elif page == "📝 Summary":
     st.header("Generate Summary")
 
@@ -175,70 +449,48 @@ elif page == "📝 Summary":
     else:
         st.info(f"Found {len(source_df)} extracted feature sets. Unique sets will be summarized.")
         st.dataframe(source_df.head()) # Show a preview of what will be summarized
+        collapse_near_duplicates = st.checkbox(
+            "Collapse near-duplicate feature sets (rows that differ only in empty fields)",
+            value=False,
+            key=f"collapse_near_duplicates_{st.session_state['reset_counter']}"
+        )
 
         if st.button("Generate", key=f"generate_summaries_btn_{st.session_state['reset_counter']}", disabled=st.session_state.summary_loading):
             if not kaggle_server_url:
                 st.error("Kaggle Server URL not set. Cannot generate summaries.")
             else:
-                st.session_state.summary_loading = True
-                st.session_state.generated_summaries_list = [] # Clear previous summaries
+                unique_feature_df, row_hashes = unique_feature_rows(source_df, near_duplicates=collapse_near_duplicates)
                 st.session_state.summary_error_text = None # Clear overall errors
-                st.rerun() # Show loading state
-
-        if st.session_state.summary_loading:
-            with st.spinner("Generating summaries for unique feature sets... Please wait."):
-                unique_feature_df = source_df.drop_duplicates()
-                total_unique_sets = len(unique_feature_df)
-                
-                if total_unique_sets == 0:
+                if len(unique_feature_df) == 0:
+                    st.session_state.generated_summaries_list = []
                     st.session_state.summary_error_text = "No unique feature sets found to summarize."
-                    st.session_state.summary_loading = False
-                    st.rerun()
                 else:
-                    progress_bar_summaries = st.progress(0)
-                    temp_summaries_list = []
-
-                    for i, row_tuple in enumerate(unique_feature_df.iterrows()):
-                        index, row_series = row_tuple
-                        feature_payload = row_series.to_dict()
-                        
+                    # Only rows whose hash has no summary yet go to the backend; the rest reuse the index
+                    summary_index = st.session_state.summary_index
+                    new_rows_mask = [row_hash not in summary_index for row_hash in row_hashes]
+                    METRICS.increment("cache.summary.hit", new_rows_mask.count(False))
+                    METRICS.increment("cache.summary.miss", new_rows_mask.count(True))
+                    st.session_state.summary_row_hashes = row_hashes
+                    st.session_state.summary_pending_hashes = [row_hash for row_hash, is_new in zip(row_hashes, new_rows_mask) if is_new]
+                    if st.session_state.summary_pending_hashes:
                         # The backend filters by `cols`. Client sends all, backend filters.
-                        # Ensure no NaN values that might cause JSON issues if not handled by backend.
-                        # df.to_dict usually handles this, but good to be aware.
                         # Pandas NaNs become `null` in JSON, which is fine.
+                        st.session_state.summary_job_id = job_manager.submit(
+                            "summarise",
+                            owner=st.session_state.session_id,
+                            params={"session_id": st.session_state.session_id, "server_url": kaggle_server_url},
+                            payloads=unique_feature_df[new_rows_mask].to_dict(orient="records"),
+                            options={"client": client_settings, "batch_size": int(batch_size)},
+                            retry=True, # A repeat Generate resumes a cancelled job or re-runs the rows that failed
+                        )
+                        st.session_state.summary_loading = True
+                    else:
+                        st.session_state.generated_summaries_list = [summary_index.get(row_hash) for row_hash in row_hashes]
+                st.rerun() # Show loading state
 
-                        api_url = f"{kaggle_server_url.rstrip('/')}/summarise_features?session_id={st.session_state.session_id}"
-                        summary_item = {"original_features": feature_payload} # Store original for context
-
-                        try:
-                            r = requests.post(api_url, json=feature_payload, timeout=120) 
-                            r.raise_for_status()
-                            response_data = r.json()
-                            if "summary" in response_data:
-                                summary_item["summary"] = response_data["summary"]
-                            elif "error" in response_data:
-                                summary_item["error"] = response_data["error"]
-                            else:
-                                summary_item["error"] = "Unexpected response format from summary API."
-                        except requests.exceptions.HTTPError as e:
-                            error_detail = f"API Error: {e.response.status_code}"
-                            try:
-                                error_json = e.response.json()
-                                error_detail += f" - {error_json.get('error', e.response.text)}"
-                            except ValueError:
-                                error_detail += f" - {e.response.text}"
-                            summary_item["error"] = error_detail
-                        except requests.exceptions.RequestException as e:
-                            summary_item["error"] = f"Connection/Request Error: {e}"
-                        except Exception as e:
-                            summary_item["error"] = f"An unexpected error occurred: {e}"
-                        
-                        temp_summaries_list.append(summary_item)
-                        progress_bar_summaries.progress((i + 1) / total_unique_sets)
-                    
-                    st.session_state.generated_summaries_list = temp_summaries_list
-                    st.session_state.summary_loading = False
-                    st.rerun() # Update UI with results
+        if st.session_state.summary_loading:
+            st.info("Generating summaries for unique feature sets... Please wait.")
+            render_job_progress(st.session_state.summary_job_id, "feature sets")
 
         if st.session_state.generated_summaries_list:
             st.markdown("### Generated Summaries")
@@ -263,12 +515,17 @@ elif page == "💬 Chat with AI":
     st.caption("🚀 AI-powered chatbot for medical insights")
 
     if "messages" not in st.session_state: st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
-    if "last_submitted_audio_bytes" not in st.session_state: st.session_state.last_submitted_audio_bytes = None
+    if "last_submitted_audio_digest" not in st.session_state: st.session_state.last_submitted_audio_digest = None
+    media_store = st.session_state.media_store
 
     # Display chat messages
+    last_message_placeholder = None
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
+            last_message_placeholder = st.empty() # Streaming replies render into the "thinking" message in place
+            last_message_placeholder.markdown(msg["content"])
+            if msg.get("ttft_seconds") is not None:
+                st.caption(f"⏱️ First token in {msg['ttft_seconds']:.2f}s · full reply in {msg['total_seconds']:.2f}s")
             if isinstance(msg.get("audio_details"), dict) and msg["role"] == "assistant": # Show user's audio transcription details under assistant message that processed it
                 details = msg["audio_details"]
                 with st.expander("See transcription details of your audio", expanded=False):
@@ -279,14 +536,21 @@ elif page == "💬 Chat with AI":
                     if "detected_language" in details:
                         st.caption(f"🌍 Detected language: {details['detected_language']}")
             
-            if msg.get("tts_audio"):
-                autoplay_flag = msg.get("autoplay_tts", False)
-                st.audio(msg["tts_audio"], format="audio/mp3", autoplay=autoplay_flag)
+            if msg.get("tts_audio_id"):
+                tts_audio = media_store.get(msg["tts_audio_id"])
+                if tts_audio is None:
+                    st.caption("🔇 Audio for this older reply was released to save memory.")
+                else:
+                    autoplay_flag = msg.get("autoplay_tts", False)
+                    st.audio(tts_audio, format=media_store.mime_type(msg["tts_audio_id"]), autoplay=autoplay_flag)
+            elif msg.get("tts_job_id"):
+                render_pending_tts(msg)
     
     st.markdown("---")
     
     # Define chat submission handler function
-    def handle_chat_submission(payload):
+    def handle_chat_submission(payload, audio_mime_type=None):
+        # payload is the JSON body, or the raw recording when audio_mime_type is set
         if not kaggle_server_url:
             if st.session_state.messages and st.session_state.messages[-1]["content"] == "⌛ Assistant is thinking...":
                 st.session_state.messages.pop()
@@ -294,29 +558,37 @@ elif page == "💬 Chat with AI":
             st.rerun()
             return
 
-        api_url = f"{kaggle_server_url.rstrip('/')}/chat_interaction?session_id={st.session_state.session_id}"
         try:
-            r = requests.post(api_url, json=payload, timeout=60)
-            r.raise_for_status()
-            response_data = r.json()
+            request_started = time.perf_counter()
+            ttft_seconds = None
+            if stream_chat_responses:
+                response_data = {}
+                streamed_text = ""
+                for event_type, event_data in backend_client.chat_stream(payload, st.session_state.session_id, audio_mime_type=audio_mime_type):
+                    if event_type == "token":
+                        if ttft_seconds is None:
+                            ttft_seconds = time.perf_counter() - request_started
+                        streamed_text += event_data
+                        if last_message_placeholder is not None:
+                            last_message_placeholder.markdown(streamed_text + "▌")
+                    else:
+                        response_data = event_data
+            elif audio_mime_type:
+                response_data = backend_client.chat_audio(payload, audio_mime_type, st.session_state.session_id)
+            else:
+                response_data = backend_client.chat(payload, st.session_state.session_id)
+            total_seconds = time.perf_counter() - request_started
+            if ttft_seconds is None: # Non-streaming server: the first token arrives with the whole reply
+                ttft_seconds = total_seconds
+            METRICS.record("chat.time_to_first_token", ttft_seconds)
             if st.session_state.messages and st.session_state.messages[-1]["content"] == "⌛ Assistant is thinking...":
                 st.session_state.messages.pop()
             assistant_response_content = response_data.get("response", "No response content from assistant.")
             
-            # TTS Generation
-            tts_audio_bytes = None
-            try:
-                # Convert markdown to plain text for TTS
-                html_content = markdown.markdown(assistant_response_content)
-                plain_text_for_tts = BeautifulSoup(html_content, "html.parser").get_text()
-                
-                tts = gTTS(text=plain_text_for_tts, lang='en', slow=False) # Assuming English for now
-                mp3_fp = BytesIO()
-                tts.write_to_fp(mp3_fp)
-                mp3_fp.seek(0)
-                tts_audio_bytes = mp3_fp.read()
-            except Exception as tts_err:
-                print(f"TTS Generation Error: {tts_err}") # Log error, don't block chat
+            # TTS runs on a background worker; the audio is attached to the message when it's ready
+            tts_job_id = None
+            if tts_backend is not None:
+                tts_job_id = tts_worker.submit(tts_backend, assistant_response_content)
 
             audio_details_for_display = None
             if response_data.get("input_type") == "audio":
@@ -330,7 +602,10 @@ elif page == "💬 Chat with AI":
                 "role": "assistant", 
                 "content": assistant_response_content,
                 "audio_details": audio_details_for_display, # This is for the USER's audio if applicable to display context
-                "tts_audio": tts_audio_bytes
+                "tts_audio_id": None,
+                "tts_job_id": tts_job_id,
+                "ttft_seconds": ttft_seconds,
+                "total_seconds": total_seconds
             }
             
             # Determine if TTS should autoplay based on user's input type
@@ -367,28 +642,47 @@ elif page == "💬 Chat with AI":
     chat_input_disabled = not kaggle_server_url
 
     # Process pending audio payload (set in a previous run)
-    if "pending_audio_payload" in st.session_state and st.session_state.pending_audio_payload:
-        payload_to_send = st.session_state.pop("pending_audio_payload")
-        # Crucially, now mark the source bytes (that created this payload) as processed
-        if "pending_audio_payload_source_bytes" in st.session_state:
-             st.session_state.last_submitted_audio_bytes = st.session_state.pop("pending_audio_payload_source_bytes")
-        handle_chat_submission(payload_to_send)
+    if st.session_state.get("pending_audio_id"):
+        pending_audio_id = st.session_state.pop("pending_audio_id")
+        # Crucially, now mark the recording (that created this payload) as processed
+        st.session_state.last_submitted_audio_digest = st.session_state.pop("pending_audio_source_digest", None)
+        pending_audio_bytes = media_store.get(pending_audio_id)
+        media_store.discard(pending_audio_id) # Only the digest is needed once it's sent
+        accepted_audio_types = backend_client.audio_upload_types() if backend_client is not None and voice_upload_mode == "Binary (compressed)" else frozenset()
+        binary_upload = encode_for_upload(pending_audio_bytes, accepted_audio_types) if pending_audio_bytes is not None and accepted_audio_types else None
+        if binary_upload is not None:
+            audio_body, audio_mime_type = binary_upload
+            del pending_audio_bytes, binary_upload
+            handle_chat_submission(audio_body, audio_mime_type=audio_mime_type)
+        elif pending_audio_bytes is not None: # Server only understands the original base64 JSON body, or none of its binary types can be encoded here
+            payload_to_send = {"audio": base64.b64encode(pending_audio_bytes).decode('utf-8')}
+            del pending_audio_bytes
+            handle_chat_submission(payload_to_send)
+        else:
+            if st.session_state.messages and st.session_state.messages[-1]["content"] == "⌛ Assistant is thinking...":
+                st.session_state.messages.pop()
+            st.session_state.messages.append({"role": "assistant", "content": "⚠️ Your recording was lost before it could be sent. Please record it again."})
+            st.rerun()
 
     # Detect new audio from the component in the current run
-    elif wav_audio_data is not None and wav_audio_data != st.session_state.last_submitted_audio_bytes:
+    elif wav_audio_data is not None and (wav_audio_digest := media_digest(wav_audio_data)) != st.session_state.last_submitted_audio_digest:
         # This block is entered ONLY if new audio is recorded and it's different from the last *submitted* one.
         if chat_input_disabled:
             st.warning("Cannot send audio: Kaggle Server URL missing.")
         else:
             st.audio(wav_audio_data, format='audio/wav')
-            audio_b64 = base64.b64encode(wav_audio_data).decode('utf-8')
             
             st.session_state.messages.append({"role": "user", "content": "🎤 User sent an audio message."})
             st.session_state.messages.append({"role": "assistant", "content": "⌛ Assistant is thinking..."})
             
-            # Store the actual audio data bytes that will form this payload
-            st.session_state.pending_audio_payload_source_bytes = wav_audio_data 
-            st.session_state.pending_audio_payload = {"audio": audio_b64} # Set payload for next run
+            # Keep one 16 kHz mono copy of the recording in the media store; the payload is built when it's sent
+            try:
+                upload_audio = downsample_wav(wav_audio_data)
+            except Exception as audio_err:
+                print(f"Audio Downsampling Error: {audio_err}") # Send the original recording instead
+                upload_audio = wav_audio_data
+            st.session_state.pending_audio_id = media_store.put(upload_audio, "audio/wav") # Sent on next run
+            st.session_state.pending_audio_source_digest = wav_audio_digest
             
             st.rerun() # Rerun to show user message & thinking, then process on next run
 
@@ -406,4 +700,37 @@ elif page == "💬 Chat with AI":
             st.rerun()
 
 else:
-    st.error("Page not found.")
\ No newline at end of file
+    st.error("Page not found.")
+
+# Rendered last so it includes this run's parsing and backend calls
+with st.sidebar:
+    with st.expander("Performance (server-wide)"):
+        # METRICS is one registry for the whole process, so this is every session's and background job's activity
+        st.caption("Timings and counters since the server started, across all sessions and background jobs.")
+        metrics_snapshot = METRICS.snapshot()
+        if metrics_snapshot["stages"]:
+            stages_df = pd.DataFrame.from_dict(metrics_snapshot["stages"], orient="index").sort_index()
+            st.dataframe(
+                stages_df[["count", "errors", "error_rate", "p50_seconds", "p95_seconds", "mean_seconds", "bytes_sent", "bytes_received"]],
+                use_container_width=True
+            )
+            stage_errors = {stage: stats["last_error"] for stage, stats in metrics_snapshot["stages"].items() if stats["last_error"]}
+            for stage, last_error in stage_errors.items():
+                st.caption(f"⚠️ {stage}: {last_error}")
+        else:
+            st.caption("No timings recorded yet.")
+        if metrics_snapshot["counters"]:
+            st.dataframe(pd.Series(metrics_snapshot["counters"], name="count").sort_index(), use_container_width=True)
+
+        export_format = st.radio("Export format", ["Prometheus text", "JSON lines"], horizontal=True, key="metrics-export-format")
+        if export_format == "Prometheus text":
+            metrics_path, metrics_fmt = os.path.join(DEFAULT_CACHE_DIR, "metrics.prom"), "prometheus"
+        else:
+            metrics_path, metrics_fmt = os.path.join(DEFAULT_CACHE_DIR, "metrics.jsonl"), "jsonl"
+        if st.button("Export metrics to file"):
+            st.success(f"Metrics written to {METRICS.export(metrics_path, metrics_fmt)}")
+        st.download_button(
+            "Download metrics",
+            data=METRICS.to_prometheus() if metrics_fmt == "prometheus" else METRICS.to_json_line() + "\n",
+            file_name=os.path.basename(metrics_path),
+        )
\ No newline at end of file
@@ -0,0 +1,158 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+
+def _canonical_value(value):
+    # Per-cell fallback for mixed object columns (e.g. nested dicts/lists), which hash_pandas_object can't hash
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, sort_keys=True, default=str)
+    if isinstance(value, str):
+        return value if value.strip() else None
+    if isinstance(value, (float, np.floating)):
+        if math.isnan(value):
+            return None
+        return str(int(value)) if float(value).is_integer() else str(float(value))
+    return str(value)
+
+
+def _canonical_numbers(series):
+    # A missing value elsewhere turns an int column into floats, so 3.0 has to read like 3
+    if not pd.api.types.is_float_dtype(series):
+        return series.astype(object).where(series.isna(), series.astype(str))
+    text = pd.Series(None, index=series.index, dtype=object)
+    whole = ((series % 1 == 0) & (series.abs() < 2 ** 53)).to_numpy() # Larger floats don't fit int64 and keep their float text
+    fractional = series.notna().to_numpy() & ~whole
+    text[whole] = series[whole].astype("int64").astype(str)
+    text[fractional] = series[fractional].astype(str)
+    return text
+
+
+def _canonical_column(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    if pd.api.types.is_bool_dtype(series):
+        text = series.astype(object).where(series.isna(), series.astype(str))
+    elif pd.api.types.is_numeric_dtype(series):
+        text = _canonical_numbers(series)
+    else:
+        inferred = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred in ("string", "empty"):
+            text = series.astype(object)
+            text = text.where(series.str.strip().ne("").fillna(False).astype(bool))
+        elif inferred in ("integer", "floating", "mixed-integer-float", "decimal"):
+            text = _canonical_numbers(pd.to_numeric(series))
+        else:
+            return pd.Series([_canonical_value(value) for value in series], index=series.index, dtype=object)
+    return text.astype(object).where(text.notna(), None)
+
+
+def normalize_features(df):
+    """Each feature column as canonical text, None where empty, so the same row reads the same from any frame.
+
+    Column order, blank strings, the various missing markers (None/NaN/NaT) and int columns that
+    became floats don't change a row's identity. Whole columns are converted at once; only object
+    columns that actually mix types (dicts, lists...) fall back to a per-cell conversion.
+    """
+    normalized = df.reindex(sorted(df.columns, key=str), axis=1)
+    return pd.DataFrame({column: _canonical_column(normalized[column]) for column in normalized.columns}, index=normalized.index)
+
+
+def feature_row_hashes(df):
+    """Stable per-row hashes, computed vectorized; returned as strings so they can key JSON/session state."""
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    hashes = pd.util.hash_pandas_object(normalize_features(df), index=False)
+    return hashes.astype(str)
+
+
+def _row_keys(codes):
+    # One int64 per row for a block of factorized columns, renumbered whenever the mixed radix would overflow
+    keys = np.zeros(len(codes), dtype=np.int64)
+    span = 1
+    for column in codes.T:
+        radix = int(column.max()) + 2 # codes start at -1
+        if span * radix >= 2 ** 62:
+            keys, uniques = pd.factorize(keys)
+            keys = keys.astype(np.int64)
+            span = len(uniques)
+        keys = keys * radix + (column + 1)
+        span *= radix
+    return keys
+
+
+def _covered_rows(normalized):
+    # A row is covered when another row has the same value in every field this row fills in, i.e. the two
+    # differ only in fields left empty here. Rows are already unique, so the other row fills strictly more
+    # fields; and coverage is transitive, so it doesn't matter whether that row is kept itself.
+    # Rows are grouped by which fields they fill and each group is looked up in one go.
+    codes = np.column_stack([pd.factorize(normalized[column])[0] for column in normalized.columns]) # -1 marks an empty field
+    filled = codes != -1
+    patterns, pattern_of_row = np.unique(filled, axis=0, return_inverse=True)
+    # Rows sorted by pattern, so each pattern's rows are one slice
+    by_pattern = np.argsort(pattern_of_row.reshape(-1), kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(pattern_of_row.reshape(-1), minlength=len(patterns)))])
+    covered = np.zeros(len(codes), dtype=bool)
+    for k, pattern in enumerate(patterns):
+        if pattern.all():
+            continue # Nothing can fill more fields
+        rows = by_pattern[bounds[k]:bounds[k + 1]]
+        columns = np.flatnonzero(pattern)
+        supersets = np.flatnonzero(patterns[:, columns].all(axis=1))
+        candidates = np.concatenate([by_pattern[bounds[j]:bounds[j + 1]] for j in supersets if j != k] or [np.empty(0, dtype=np.intp)])
+        if not len(candidates):
+            continue
+        if not len(columns):
+            covered[rows] = True # An empty row is covered by any other row
+            continue
+        keys = _row_keys(codes[np.concatenate([candidates, rows])[:, None], columns])
+        covered[rows] = np.isin(keys[len(candidates):], keys[:len(candidates)])
+    return covered
+
+
+def unique_feature_rows(df, near_duplicates=False):
+    """Returns (unique rows, their hashes). With near_duplicates, rows that differ from a kept row
+    only in empty fields are collapsed into it as well."""
+    if df.empty:
+        return df, []
+    normalized = normalize_features(df) # Once, for both the hashes and the near-duplicate check
+    hashes = pd.util.hash_pandas_object(normalized, index=False).astype(str)
+    unique_mask = ~hashes.duplicated().to_numpy()
+    unique_df = df[unique_mask]
+    unique_hashes = hashes[unique_mask]
+    if near_duplicates and len(unique_df) > 1:
+        keep_mask = ~_covered_rows(normalized[unique_mask])
+        unique_df = unique_df[keep_mask]
+        unique_hashes = unique_hashes[keep_mask]
+    return unique_df, unique_hashes.tolist()
+
+
+class SummaryIndex:
+    """Per-session map of feature-row hash -> summary item, so Generate only summarizes rows it hasn't seen."""
+
+    def __init__(self):
+        self._summaries = {}
+
+    def __contains__(self, row_hash):
+        return row_hash in self._summaries
+
+    def missing(self, row_hashes):
+        return [row_hash for row_hash in row_hashes if row_hash not in self._summaries]
+
+    def add(self, row_hash, summary_item):
+        # Failed summaries aren't indexed; the next Generate resubmits their rows with retry=True, which re-runs them
+        if "summary" in summary_item:
+            self._summaries[row_hash] = summary_item
+
+    def get(self, row_hash):
+        return self._summaries.get(row_hash)
+
+    def clear(self):
+        self._summaries.clear()
+
+    def __len__(self):
+        return len(self._summaries)
@@ -0,0 +1,289 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import markdown
+from bs4 import BeautifulSoup
+
+from metrics import METRICS
+
+
+def markdown_to_speech_text(markdown_text):
+    # Convert markdown to plain text for TTS
+    html_content = markdown.markdown(markdown_text)
+    return BeautifulSoup(html_content, "html.parser").get_text()
+
+
+def split_sentences(text, max_chars=300):
+    """Splits text into sentence chunks of at most ~max_chars so the first one can be synthesized quickly."""
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if s.strip()]
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        # Long sentences without punctuation are split on whitespace
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+        if not chunks and current:
+            # The first sentence goes alone so playback can start as early as possible
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def join_wav(chunks):
+    out = BytesIO()
+    params = None
+    with wave.open(out, "wb") as writer:
+        for chunk in chunks:
+            with wave.open(BytesIO(chunk), "rb") as reader:
+                if params is None:
+                    params = reader.getparams()
+                    writer.setparams(params)
+                writer.writeframes(reader.readframes(reader.getnframes()))
+    return out.getvalue()
+
+
+# Layer III bitrates (kbps) by bitrate index, for MPEG-1 and for MPEG-2/2.5
+MP3_BITRATES = {
+    "mpeg1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "mpeg2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+
+def _mp3_duration(audio):
+    offset = 0
+    if audio[:3] == b"ID3" and len(audio) >= 10: # Skip an ID3v2 tag; its size is a 4x7-bit integer
+        offset = 10 + ((audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9])
+    while offset + 4 <= len(audio):
+        if audio[offset] == 0xFF and audio[offset + 1] & 0xE0 == 0xE0:
+            version = (audio[offset + 1] >> 3) & 0x03
+            bitrate = MP3_BITRATES["mpeg1" if version == 3 else "mpeg2"][min(audio[offset + 2] >> 4, 14)]
+            if bitrate:
+                return (len(audio) - offset) * 8 / (bitrate * 1000) # gTTS writes constant-bitrate MP3
+        offset += 1
+    return len(audio) * 8 / 32000 # No frame header found; assume gTTS's usual 32 kbps
+
+
+def audio_duration(audio, mime_type):
+    """Approximate playing time of a WAV or MP3 clip in seconds."""
+    if mime_type == "audio/wav":
+        with wave.open(BytesIO(audio), "rb") as reader:
+            return reader.getnframes() / reader.getframerate()
+    return _mp3_duration(audio)
+
+
+class GTTSBackend:
+    name = "gtts"
+    mime_type = "audio/mp3"
+
+    def __init__(self, lang="en", slow=False):
+        self.lang = lang
+        self.slow = slow
+
+    def synthesize(self, text):
+        from gtts import gTTS
+        mp3_fp = BytesIO()
+        gTTS(text=text, lang=self.lang, slow=self.slow).write_to_fp(mp3_fp)
+        return mp3_fp.getvalue()
+
+    def join(self, chunks):
+        # MP3 is a stream of frames, so chunks can simply be concatenated
+        return b"".join(chunks)
+
+
+class Pyttsx3Backend:
+    """Offline speech via the system speech engine (espeak/SAPI/NSSpeech); needs `pip install pyttsx3`."""
+
+    name = "pyttsx3"
+    mime_type = "audio/wav"
+
+    def __init__(self):
+        import pyttsx3 # noqa: F401 - fail fast when the optional dependency is missing
+        self._lock = threading.Lock() # pyttsx3 engines aren't thread-safe
+
+    def synthesize(self, text):
+        import pyttsx3
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            with self._lock:
+                engine = pyttsx3.init()
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+            with open(path, "rb") as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+    def join(self, chunks):
+        return join_wav(chunks)
+
+
+class SilentBackend:
+    """Network-free stand-in that returns silence sized to the text; for tests and offline development."""
+
+    name = "silent"
+    mime_type = "audio/wav"
+
+    def __init__(self, sample_rate=8000, seconds_per_char=0.01):
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text):
+        out = BytesIO()
+        with wave.open(out, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(self.sample_rate)
+            writer.writeframes(b"\0\0" * int(self.sample_rate * self.seconds_per_char * max(1, len(text))))
+        return out.getvalue()
+
+    def join(self, chunks):
+        return join_wav(chunks)
+
+
+TTS_BACKENDS = {
+    "gTTS (online)": GTTSBackend,
+    "Offline (pyttsx3)": Pyttsx3Backend,
+    "Silent (testing)": SilentBackend,
+}
+
+
+class AudioLRUCache:
+    """Thread-safe LRU of synthesized audio keyed by text hash, bounded by total bytes."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(backend_name, text):
+        return hashlib.sha256(f"{backend_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._items.get(key)
+            if audio is None:
+                self.misses += 1
+                METRICS.increment("cache.tts.miss")
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            METRICS.increment("cache.tts.hit")
+            return audio
+
+    def put(self, key, audio):
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key))
+            self._items[key] = audio
+            self._size += len(audio)
+            while self._size > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class TTSJob:
+    def __init__(self, backend, text_chunks):
+        self.backend = backend
+        self.text_chunks = text_chunks
+        self.audio_chunks = []
+        self.error = None
+        self.done = False
+        self.finished_at = None
+
+    @property
+    def mime_type(self):
+        return self.backend.mime_type
+
+    def audio(self):
+        # Full reply as one clip once every chunk is synthesized
+        return self.backend.join(self.audio_chunks) if self.audio_chunks else None
+
+
+class TTSWorker:
+    """Synthesizes assistant replies on background threads so chat turns don't wait on speech.
+
+    submit() returns a job id immediately; the caller polls job(job_id) to pick up audio
+    chunks as they become ready and pop() once the job is done. Finished jobs nobody popped
+    (session reset, page left, tab closed) are dropped after max_age_seconds, or oldest first
+    beyond max_finished_jobs, so their audio doesn't stay in the process forever.
+    """
+
+    def __init__(self, max_workers=2, cache=None, max_chunk_chars=300, max_age_seconds=600, max_finished_jobs=32):
+        self.cache = cache or AudioLRUCache()
+        self.max_chunk_chars = max_chunk_chars
+        self.max_age_seconds = max_age_seconds
+        self.max_finished_jobs = max_finished_jobs
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, backend, markdown_text):
+        job = TTSJob(backend, split_sentences(markdown_to_speech_text(markdown_text), self.max_chunk_chars))
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = job
+        self._pool.submit(self._run, job)
+        return job_id
+
+    def _run(self, job):
+        try:
+            for text in job.text_chunks:
+                key = self.cache.key(job.backend.name, text)
+                audio = self.cache.get(key)
+                if audio is None:
+                    with METRICS.timer(f"tts.{job.backend.name}") as measurement:
+                        audio = job.backend.synthesize(text)
+                        measurement.bytes_received = len(audio)
+                    self.cache.put(key, audio)
+                job.audio_chunks.append(audio) # Readers only ever see whole chunks
+        except Exception as tts_err:
+            job.error = tts_err
+            print(f"TTS Generation Error: {tts_err}") # Log error, don't block chat
+        finally:
+            job.finished_at = time.monotonic()
+            job.done = True
+
+    def _expire(self):
+        # Called with the lock held; _jobs is in submission order, so the oldest finished jobs go first
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        cutoff = time.monotonic() - self.max_age_seconds
+        excess = len(finished) - self.max_finished_jobs
+        for i, job_id in enumerate(finished):
+            if i < excess or self._jobs[job_id].finished_at < cutoff:
+                del self._jobs[job_id]
+
+    def job(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pop(self, job_id):
+        with self._lock:
+            return self._jobs.pop(job_id, None)